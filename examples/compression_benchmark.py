@@ -0,0 +1,79 @@
+import gzip
+import http.server
+import json
+import random
+import threading
+
+from growattServer.session import GrowattSession
+
+"""
+Compares the bytes received with and without compressed responses for realistic payloads.
+Starts a local stand-in for the Growatt server that gzips responses when the client accepts it,
+no account is needed.
+"""
+
+random.seed(1)
+payloads = {
+    # sph_detail returns hundreds of settings fields
+    '/v1/device/mix/mix_data_info': {
+        'error_code': 0,
+        'data': {f'setting{i}': str(random.randint(0, 100)) for i in range(400)} | {
+            f'forcedChargeTimeStart{i}': f"{random.randrange(24)}:0" for i in range(1, 4)},
+    },
+    # A page of 100 history rows
+    '/v1/device/tlx/tlx_data': {
+        'error_code': 0,
+        'data': {'count': 100, 'datas': [
+            {field: round(random.uniform(0, 5000), 1) for field in (
+                'pac', 'ppv', 'ppv1', 'ppv2', 'vpv1', 'vpv2', 'ipv1', 'ipv2', 'vac1', 'iac1', 'fac', 'temp1',
+                'eacToday', 'eacTotal', 'epvToday', 'epvTotal', 'bdc1Soc', 'pcharge1', 'pdischarge1')}
+            | {'time': f"2024-01-01 {i // 12:02d}:{i % 12 * 5:02d}:00", 'tlxSn': 'DEVICE_SERIAL_NUMBER'}
+            for i in range(100)]},
+    },
+    # dashboard_data with a day of 5 minute chart data
+    '/newPlantAPI.do': {
+        'chartData': {f"{minute // 60:02d}:{minute % 60:02d}": {
+            'pacToUser': str(round(random.uniform(0, 3), 2)),
+            'ppv': str(round(random.uniform(0, 5), 2)),
+            'sysOut': str(round(random.uniform(0, 2), 2)),
+            'userLoad': str(round(random.uniform(0, 2), 2)),
+        } for minute in range(0, 24 * 60, 5)},
+        'chartDataUnit': 'kW',
+    },
+}
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(payloads[self.path.split('?')[0]]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+for label, accept_encoding in (('uncompressed', 'identity'), ('default', None)):
+    session = GrowattSession()
+    if accept_encoding:
+        session.headers['Accept-Encoding'] = accept_encoding
+    for path in payloads:
+        for _ in range(10):
+            session.get(base_url + path)
+
+    print(f"{label} (Accept-Encoding: {session.headers['Accept-Encoding']})")
+    for endpoint, stats in session.transfer_stats().items():
+        print(f"  {endpoint:32} {stats['compressed_bytes'] / stats['requests']:9.0f} bytes on the wire, "
+              f"{stats['decompressed_bytes'] / stats['requests']:9.0f} bytes decompressed per response")
+
+server.shutdown()
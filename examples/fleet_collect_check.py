@@ -0,0 +1,100 @@
+import json
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+
+from growattServer import FleetAggregator, OpenApiV1
+from growattServer.exceptions import GrowattParameterError
+
+"""
+Checks FleetAggregator.collect against a stand-in transport serving an OpenAPI V1 account with
+two plants: MIN inverters A and B, and device C of a type the API client does not support (16).
+C is skipped, and repeated device_type() lookups of C do not walk the account every time.
+No account is needed.
+"""
+
+
+class StandInTransport(BaseAdapter):
+    """
+    Answers OpenAPI V1 requests from canned data and counts the requests per endpoint.
+    """
+
+    devices = {
+        '1': [{'device_sn': 'A', 'type': 7}, {'device_sn': 'C', 'type': 16}],
+        '2': [{'device_sn': 'B', 'type': 7}],
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.requests = {}
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        endpoint = url.path.split('/v1/', 1)[1]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if request.body:
+            body = request.body if isinstance(request.body, str) else request.body.decode()
+            params.update({key: values[0] for key, values in parse_qs(body).items()})
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+        if endpoint == 'plant/list':
+            data = {'plants': [{'plant_id': plant_id} for plant_id in self.devices]}
+        elif endpoint == 'device/list':
+            devices = self.devices[params['plant_id']]
+            data = {'count': len(devices), 'devices': devices}
+        elif endpoint == 'plant/data':
+            data = {'today_energy': '1.5', 'total_energy': '100', 'current_power': 1000}
+        elif endpoint == 'device/tlx/tlxs_data':
+            data = {'tlxs': [{'tlx_sn': device_sn, 'data': {'ppv': 2000.0, 'epvToday': 3.0}}
+                             for device_sn in params['tlxs'].split(',')]}
+        else:
+            return self.respond(request, {'error_code': 10001, 'error_msg': f'unknown endpoint {endpoint}'})
+        return self.respond(request, {'error_code': 0, 'error_msg': '', 'data': data})
+
+    @staticmethod
+    def respond(request, payload):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(payload).encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+api = OpenApiV1(token="stand-in")
+transport = StandInTransport()
+api.session.mount('https://', transport)
+
+aggregator = FleetAggregator()
+totals = aggregator.collect(api)
+assert set(aggregator._devices) == {'A', 'B'}, aggregator._devices
+assert totals['fleet']['pv_power'] == 4000.0, totals['fleet']
+assert transport.requests == {'plant/list': 1, 'device/list': 2, 'plant/data': 2, 'device/tlx/tlxs_data': 1}, \
+    transport.requests
+print(f"collect: fleet pv_power {totals['fleet']['pv_power']} W, requests {transport.requests}")
+
+# A second collect skips C again without walking the account for it
+transport.requests.clear()
+aggregator.collect(api)
+assert transport.requests == {'plant/list': 1, 'device/list': 2, 'plant/data': 2, 'device/tlx/tlxs_data': 1}, \
+    transport.requests
+print("collect: device C of unsupported type 16 skipped")
+
+# Looking up a serial number that is not in the index walks the account at most once per
+# device_types_refresh_interval
+transport.requests.clear()
+for _ in range(3):
+    try:
+        api.device_type('C')
+    except GrowattParameterError:
+        pass
+    else:
+        raise AssertionError("device C has no known type")
+assert transport.requests == {'plant/list': 1, 'device/list': 2}, transport.requests
+assert api.device_type('B').name == 'MIN'
+print(f"device_type: 3 lookups of device C, requests {transport.requests}")
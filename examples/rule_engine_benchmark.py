@@ -0,0 +1,45 @@
+import random
+import time
+
+from growattServer.rules import Rule, RuleEngine
+
+"""
+Measures one polling cycle of 300 rules on 10000 devices with growattServer.rules.RuleEngine,
+where about one in ten devices reports changed power values, compared with evaluating every rule
+on every device. Uses generated min_energy data, no account is needed.
+"""
+
+random.seed(1)
+fields = ['ppv', 'pac', 'bdc1Soc', 'status', 'lost'] + [f'vpv{i}' for i in range(1, 16)]
+rules = [Rule('offline', 'lost', '==', True), Rule('status', 'status', 'changed')]
+while len(rules) < 300:
+    field = random.choice(fields[:3] + fields[5:])
+    rules.append(Rule(f'rule{len(rules)}', field, random.choice(('<', '>')), random.uniform(0, 5000)))
+
+devices = {f'DEVICE{i:05d}': {field: str(round(random.uniform(0, 5000), 1)) for field in fields}
+           for i in range(10000)}
+for data in devices.values():
+    data.update(status='1', lost=False)
+
+engine = RuleEngine(rules)
+for device_sn, data in devices.items():
+    engine.evaluate(device_sn, data, 'min')
+
+# The next cycle: one in ten devices changed its power values
+for data in random.sample(list(devices.values()), 1000):
+    data.update(ppv=str(round(random.uniform(0, 5000), 1)), pac=str(round(random.uniform(0, 5000), 1)))
+
+started = time.perf_counter()
+for device_sn, data in devices.items():
+    engine.evaluate(device_sn, data, 'min')
+incremental = time.perf_counter() - started
+
+started = time.perf_counter()
+for device_sn, data in devices.items():
+    for rule in rules:
+        if rule.op != 'changed':
+            rule.check([data.get(field) for field in rule.fields], False)
+full = time.perf_counter() - started
+
+print(f"every rule on every device: {full * 1000:8.1f} ms per cycle")
+print(f"RuleEngine:                 {incremental * 1000:8.1f} ms per cycle")
@@ -0,0 +1,245 @@
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+from growattServer.sinks import FileSink, MqttSink, Sink, SinkPipeline
+
+"""
+Checks the output sinks and the backpressure policies of growattServer.SinkPipeline against
+local stand-ins: a temporary file, a minimal in-process MQTT broker and a sink that fails or
+stalls on demand. MqttSink requires paho-mqtt (`pip install paho-mqtt`), no account is needed.
+"""
+
+
+class StandInSink(Sink):
+    """
+    Collects the written records, fails while `failing` is set and stalls while `stalled` is cleared.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.writes = 0
+        self.failing = False
+        self.stalled = threading.Event()
+        self.stalled.set()
+        self.writing = False
+        self.closed = None
+
+    def write(self, records):
+        self.writing = True
+        self.stalled.wait()
+        self.writing = False
+        self.writes += 1
+        if self.failing:
+            raise OSError("stand-in sink is failing")
+        self.records.extend(records)
+
+    def close(self):
+        # 'during write' when the sink was closed under an in-flight write
+        self.closed = 'during write' if self.writing else 'after write'
+
+
+class StandInBroker(socketserver.ThreadingTCPServer):
+    """
+    Accepts MQTT 3.1.1 connections and collects the (topic, payload) of every PUBLISH packet.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInBrokerHandler)
+        self.messages = []
+
+
+class StandInBrokerHandler(socketserver.BaseRequestHandler):
+    def read(self, count):
+        data = b''
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def handle(self):
+        try:
+            while True:
+                header = self.read(1)[0]
+                length, shift = 0, 0
+                while True:
+                    byte = self.read(1)[0]
+                    length |= (byte & 0x7f) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = self.read(length)
+                packet = header >> 4
+                if packet == 1:  # CONNECT
+                    self.request.sendall(b'\x20\x02\x00\x00')
+                elif packet == 3:  # PUBLISH
+                    qos = (header >> 1) & 3
+                    topic_length = int.from_bytes(body[:2], 'big')
+                    topic = body[2:2 + topic_length].decode()
+                    offset = 2 + topic_length
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                        self.request.sendall(b'\x40\x02' + packet_id)
+                    self.server.messages.append((topic, json.loads(body[offset:])))
+                elif packet == 12:  # PINGREQ
+                    self.request.sendall(b'\xd0\x00')
+                elif packet == 14:  # DISCONNECT
+                    return
+        except (ConnectionError, OSError):
+            pass
+
+
+def records(count, start=0):
+    return [{'device_sn': f'DEVICE{i % 3}', 'device_type': 'min', 'data': {'ppv': i}, 'i': i}
+            for i in range(start, start + count)]
+
+
+directory = tempfile.mkdtemp()
+
+# FileSink: every record as a JSON line, flush() does not wait for the flush interval
+path = os.path.join(directory, 'records.jsonl')
+pipeline = SinkPipeline(FileSink(path), batch_size=100, flush_interval=3)
+for record in records(10):
+    pipeline.put(record)
+started = time.monotonic()
+assert pipeline.flush(timeout=5)
+flushed = time.monotonic() - started
+pipeline.close()
+with open(path, encoding='utf-8') as file:
+    assert [json.loads(line)['i'] for line in file] == list(range(10))
+assert flushed < 1, flushed
+print(f"FileSink: 10 records written, flush took {flushed * 1000:.1f} ms with flush_interval=3")
+
+# MqttSink against the stand-in broker
+try:
+    import paho.mqtt.client  # noqa: F401
+except ImportError:
+    print("MqttSink: skipped, paho-mqtt is not installed")
+else:
+    broker = StandInBroker()
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+    sink = MqttSink('127.0.0.1', broker.server_address[1], topic='growatt/{device_type}/{device_sn}', qos=1)
+    with SinkPipeline(sink, batch_size=4, flush_interval=3) as pipeline:
+        for record in records(10):
+            pipeline.put(record)
+        assert pipeline.flush(timeout=5)
+    assert [payload['i'] for topic, payload in broker.messages] == list(range(10))
+    assert broker.messages[4][0] == 'growatt/min/DEVICE1'
+    broker.shutdown()
+    print(f"MqttSink: {len(broker.messages)} records published with qos=1")
+
+# block: put() waits while the queue is full
+sink = StandInSink()
+sink.stalled.clear()
+pipeline = SinkPipeline(sink, max_queue=5, batch_size=5, flush_interval=0.05, policy='block')
+putter = threading.Thread(target=lambda: [pipeline.put(record) for record in records(20)])
+putter.start()
+time.sleep(0.3)
+assert putter.is_alive() and len(pipeline._queue) == 5
+sink.stalled.set()
+putter.join(5)
+assert pipeline.flush(timeout=5)
+pipeline.close()
+assert [record['i'] for record in sink.records] == list(range(20))
+assert pipeline.stats['dropped'] == 0
+print(f"block: {pipeline.stats}")
+
+# drop_oldest: the oldest queued records are dropped, put() never waits
+sink = StandInSink()
+sink.stalled.clear()
+pipeline = SinkPipeline(sink, max_queue=5, batch_size=5, flush_interval=0.05, policy='drop_oldest')
+pipeline.put(records(1)[0])
+time.sleep(0.2)  # the writer took the first record and stalls on it
+started = time.monotonic()
+for record in records(20, start=1):
+    pipeline.put(record)
+assert time.monotonic() - started < 0.5
+sink.stalled.set()
+assert pipeline.flush(timeout=5)
+pipeline.close()
+assert [record['i'] for record in sink.records] == [0] + list(range(16, 21))
+assert pipeline.stats['dropped'] == 15
+print(f"drop_oldest: {pipeline.stats}")
+
+# spill: records overflow to the spill file, a failing batch is retried once per flush_interval
+# and everything is written in order once the sink recovers
+spill_path = os.path.join(directory, 'spill.jsonl')
+sink = StandInSink()
+sink.failing = True
+pipeline = SinkPipeline(sink, max_queue=5, batch_size=5, flush_interval=0.5, policy='spill', spill_path=spill_path)
+for record in records(50):
+    pipeline.put(record)
+    time.sleep(0.02)
+# About 1 second of failures: the retries are not triggered by every put()
+assert sink.writes <= 4, sink.writes
+assert pipeline.stats['spilled'] > 0
+sink.failing = False
+assert pipeline.flush(timeout=5)
+assert [record['i'] for record in sink.records] == list(range(50))
+pipeline.close()
+print(f"spill: {pipeline.stats}, {sink.writes} writes")
+
+# spill: records not written on close are kept and written by the next pipeline
+sink = StandInSink()
+sink.failing = True
+pipeline = SinkPipeline(sink, max_queue=5, batch_size=5, flush_interval=0.2, policy='spill', spill_path=spill_path)
+for record in records(12):
+    pipeline.put(record)
+pipeline.close(timeout=1)
+assert not sink.records
+sink = StandInSink()
+with SinkPipeline(sink, max_queue=5, batch_size=5, flush_interval=0.2, policy='spill',
+                  spill_path=spill_path) as pipeline:
+    for record in records(3, start=12):
+        pipeline.put(record)
+    assert pipeline.flush(timeout=5)
+assert [record['i'] for record in sink.records] == list(range(15))
+print(f"spill restart: {len(sink.records)} records written in order after a restart")
+
+# spill: a line cut off by a crash is skipped, the writer keeps running
+with open(spill_path, 'w', encoding='utf-8') as spill:
+    spill.write('{"i": 0}\n{"i": 1}\n{"i": 2')
+sink = StandInSink()
+with SinkPipeline(sink, max_queue=5, batch_size=5, flush_interval=0.2, policy='spill',
+                  spill_path=spill_path) as pipeline:
+    pipeline.put({'i': 3})
+    assert pipeline.flush(timeout=2)
+    assert pipeline._thread.is_alive()
+assert [record['i'] for record in sink.records] == [0, 1, 3]
+assert pipeline.stats['invalid'] == 1
+print(f"spill torn line: {pipeline.stats['invalid']} invalid line skipped, {len(sink.records)} records written")
+
+# close() timing out during a write: the sink is closed after the write, the batch is kept in the
+# spill file until it is written and removed again when the write succeeds
+for failing in (False, True):
+    os.remove(spill_path)
+    sink = StandInSink()
+    sink.stalled.clear()
+    pipeline = SinkPipeline(sink, max_queue=5, batch_size=2, flush_interval=0.05, policy='spill',
+                            spill_path=spill_path)
+    for record in records(4):
+        pipeline.put(record)
+    time.sleep(0.2)
+    pipeline.close(timeout=0.2)
+    assert sink.closed is None
+    with open(spill_path, encoding='utf-8') as spill:
+        assert [json.loads(line)['i'] for line in spill] == [0, 1, 2, 3]
+    sink.failing = failing
+    sink.stalled.set()
+    pipeline._thread.join(2)
+    assert sink.closed == 'after write'
+    with open(spill_path, encoding='utf-8') as spill:
+        assert [json.loads(line)['i'] for line in spill] == ([0, 1, 2, 3] if failing else [2, 3])
+    print(f"close timeout with {'failing' if failing else 'succeeding'} write: sink closed {sink.closed}, "
+          f"{len(sink.records)} records written")
+os.remove(spill_path)
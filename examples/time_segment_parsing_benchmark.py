@@ -0,0 +1,76 @@
+import random
+import timeit
+
+from growattServer.schedules import parse_time_segments, parse_time_segments_batch
+
+"""
+Compares growattServer.schedules.parse_time_segments_batch against parsing the MIN time segments
+of every settings dict field by field, as min_read_time_segments used to, and against calling
+parse_time_segments for every inverter. Uses generated min_settings data for 2000 inverters
+sharing 50 schedules, no account is needed.
+"""
+
+random.seed(1)
+
+
+def random_time():
+    return random.choice(["null", "0:0", f"{random.randrange(24)}:{random.choice((0, 15, 30, 45))}"])
+
+
+settings_list = [
+    {
+        key: value
+        for i in range(1, 10)
+        for key, value in (
+            (f'forcedTimeStart{i}', random_time()),
+            (f'forcedTimeStop{i}', random_time()),
+            (f'forcedStopSwitch{i}', random.choice(("0", "1", "null"))),
+            (f'time{i}Mode', random.choice(("0", "1", "2", "null"))),
+        )
+    }
+    for _ in range(50)
+]
+# Inverters of a fleet mostly share a few schedules
+settings_list = [dict(random.choice(settings_list)) for _ in range(2000)]
+
+
+def field_by_field(settings_data):
+    mode_names = {0: "Load First", 1: "Battery First", 2: "Grid First"}
+    segments = []
+    for i in range(1, 10):
+        times = []
+        for field in (f'forcedTimeStart{i}', f'forcedTimeStop{i}'):
+            raw = settings_data.get(field, "0:0")
+            if raw == 'null' or not raw:
+                raw = "0:0"
+            try:
+                parts = raw.split(":")
+                times.append(f"{int(parts[0]):02d}:{int(parts[1]):02d}")
+            except (ValueError, IndexError):
+                times.append("00:00")
+        try:
+            batt_mode = int(settings_data.get(f'time{i}Mode'))
+        except (ValueError, TypeError):
+            batt_mode = None
+        try:
+            enabled = int(settings_data.get(f'forcedStopSwitch{i}', 0)) == 1
+        except (ValueError, TypeError):
+            enabled = False
+        segments.append({
+            'segment_id': i,
+            'batt_mode': batt_mode,
+            'mode_name': mode_names.get(batt_mode, "Unknown"),
+            'start_time': times[0],
+            'end_time': times[1],
+            'enabled': enabled,
+        })
+    return segments
+
+
+runs = 10
+naive_time = timeit.timeit(lambda: [field_by_field(settings) for settings in settings_list], number=runs)
+single_time = timeit.timeit(lambda: [parse_time_segments(settings) for settings in settings_list], number=runs)
+batch_time = timeit.timeit(lambda: parse_time_segments_batch(settings_list), number=runs)
+print(f"field by field parsing:     {naive_time / runs * 1e3:8.1f} ms per {len(settings_list)} inverters")
+print(f"parse_time_segments:        {single_time / runs * 1e3:8.1f} ms per {len(settings_list)} inverters")
+print(f"parse_time_segments_batch:  {batch_time / runs * 1e3:8.1f} ms per {len(settings_list)} inverters")
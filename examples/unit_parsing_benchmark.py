@@ -0,0 +1,59 @@
+import random
+import timeit
+
+from growattServer.units import parse_units
+
+"""
+Compares growattServer.units.parse_units against parsing a dashboard_data response field by field.
+Uses a generated response with a full day of 5 minute chart data, no account is needed.
+"""
+
+random.seed(1)
+chart_data = {
+    f"{minute // 60:02d}:{minute % 60:02d}": {
+        'pacToUser': str(round(random.uniform(0, 3), 2)),
+        'ppv': str(round(random.uniform(0, 5), 2)),
+        'sysOut': str(round(random.uniform(0, 2), 2)),
+        'userLoad': '0',
+    }
+    for minute in range(0, 24 * 60, 5)
+}
+dashboard = {
+    'chartData': chart_data,
+    'chartDataUnit': 'kW',
+    'eAcCharge': '20.5kWh',
+    'eCharge': '23.1kWh',
+    'eChargeToday1': '2.6kWh',
+    'eChargeToday2': '10.1kWh',
+    'echarge1': '9.3kWh',
+    'elocalLoad': '20.3kWh',
+    'etouser': '10.2kWh',
+    'photovoltaic': '0.8kWh',
+    'ratio1': '11.3%',
+    'ratio2': '88.7%',
+    'ratio3': '49.8%',
+    'ratio4': '50.2%',
+    'ratio5': '92.1%',
+    'ratio6': '7.9%',
+}
+
+
+def naive(data):
+    result = {}
+    for field, value in data.items():
+        if field == 'chartData':
+            result[field] = {time: {key: float(item) for key, item in entry.items()} for time, entry in value.items()}
+        elif isinstance(value, str) and value.endswith('kWh'):
+            result[field] = float(value[:-3])
+        elif isinstance(value, str) and value.endswith('%'):
+            result[field] = float(value[:-1])
+        else:
+            result[field] = value
+    return result
+
+
+runs = 500
+naive_time = timeit.timeit(lambda: naive(dashboard), number=runs)
+parse_time = timeit.timeit(lambda: parse_units(dashboard), number=runs)
+print(f"naive per-field parsing: {naive_time / runs * 1e6:8.1f} us per response")
+print(f"parse_units:             {parse_time / runs * 1e6:8.1f} us per response")
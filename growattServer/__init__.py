@@ -3,7 +3,33 @@ from .base_api import *
 # Import the V1 API class and DeviceType enum
 from .open_api_v1 import OpenApiV1, DeviceType
 # Import exceptions
-from .exceptions import GrowattError, GrowattParameterError, GrowattV1ApiError
+from .exceptions import (GrowattError, GrowattParameterError, GrowattV1ApiError, GrowattCircuitOpenError,
+                         GrowattDeadlineExceededError)
+# Import timeouts and deadlines
+from .timeouts import deadline, request_timeout
+# Import the circuit breaker
+from .circuit_breaker import CircuitBreaker
+# Import server selection
+from .servers import ServerSelector
+# Import rate limiting and multi-account support
+from .rate_limit import RateLimiter
+from .accounts import AccountManager
+# Import device polling
+from .poller import Poller, AdaptivePoller
+# Import history export
+from .export import HistoryExporter
+# Import change detection
+from .changes import ChangeDetector
+# Import fleet aggregation
+from .aggregate import FleetAggregator
+# Import device history
+from .history import DeviceHistory, RingBuffer
+# Import alert rules
+from .rules import Rule, RuleEngine
+# Import output sinks
+from .sinks import FileSink, MqttSink, SinkPipeline, StdoutSink
+# Import the data update coordinator
+from .coordinator import DataUpdateCoordinator
 
 # Define the name of the package
 name = "growattServer"
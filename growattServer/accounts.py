@@ -0,0 +1,257 @@
+"""
+Multi-account support for the growattServer library.
+"""
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import requests
+
+from .base_api import GrowattApi
+from .open_api_v1 import OpenApiV1
+from .rate_limit import RateLimiter
+
+
+class _Account:
+    """
+    An API client together with its rate limit budget and pending requests.
+    """
+
+    def __init__(self, name, api, limiter):
+        self.name = name
+        self.api = api
+        self.limiter = limiter
+        self.pending = deque()
+        self.busy = False
+
+
+class AccountManager:
+    """
+    Run requests for many Growatt accounts over one shared connection pool.
+
+    Every account keeps its own API client and therefore its own headers (token,
+    User-Agent) and cookies, but all clients share a single transport adapter so
+    connections and TLS sessions to the Growatt servers are reused between accounts.
+
+    Requests submitted through the manager are executed by a pool of worker threads.
+    Workers serve the accounts round-robin, one request per account at a time, and
+    skip accounts whose rate limit budget is used up, so one large account can not
+    starve the others. The rate limit is applied to the HTTP requests of the account's
+    session, so a method sending several requests (e.g. device_list) takes one token
+    for each of them.
+
+    Args:
+        max_workers (int): Number of worker threads executing requests. Defaults to 4.
+        pool_maxsize (int): Maximum number of connections kept open per host. Defaults to 10.
+        rate (float, optional): Default number of requests per `per` seconds for every account.
+            None disables rate limiting by default.
+        per (float): Length of the rate window in seconds. Defaults to 60.
+
+    Example:
+        with growattServer.AccountManager(max_workers=8) as manager:
+            manager.add_token_account("customer-a", "TOKEN_A", rate=60)
+            manager.add_login_account("customer-b", "username", "password")
+            future = manager.submit("customer-a", "min_energy", "DEVICE_SERIAL_NUMBER")
+            print(future.result())
+    """
+
+    def __init__(self, max_workers=4, pool_maxsize=10, rate=None, per=60.0):
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.rate = rate
+        self.per = per
+        self._accounts = {}
+        self._cycle = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._work, name=f"growatt-account-worker-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_account(self, name, api, rate=None, per=None):
+        """
+        Add an API client to the manager and route it over the shared connection pool.
+
+        Args:
+            name (str): Unique name of the account.
+            api (GrowattApi): The API client of the account (GrowattApi or OpenApiV1).
+            rate (float, optional): Requests per `per` seconds for this account. Defaults to the manager rate.
+            per (float, optional): Length of the rate window in seconds. Defaults to the manager window.
+
+        Returns:
+            GrowattApi: The API client.
+        """
+        if name in self._accounts:
+            raise ValueError(f"account {name} already exists")
+
+        api.session.mount('https://', self.adapter)
+        api.session.mount('http://', self.adapter)
+
+        rate = self.rate if rate is None else rate
+        limiter = RateLimiter(rate, per=self.per if per is None else per) if rate else None
+        if limiter is not None:
+            # Every HTTP request of the account takes a token
+            api.session.rate_limiter = limiter
+
+        with self._cond:
+            self._accounts[name] = _Account(name, api, limiter)
+            self._cycle.append(name)
+        return api
+
+    def add_token_account(self, name, token, rate=None, per=None):
+        """
+        Add an OpenApiV1 account using its API token.
+
+        Returns:
+            OpenApiV1: The API client of the account.
+        """
+        return self.add_account(name, OpenApiV1(token), rate=rate, per=per)
+
+    def add_login_account(self, name, username, password, is_password_hashed=False, rate=None, per=None):
+        """
+        Add a ShinePhone (GrowattApi) account and log it in.
+
+        Returns:
+            GrowattApi: The API client of the account.
+        """
+        api = self.add_account(name, GrowattApi(), rate=rate, per=per)
+        self.submit(name, 'login', username, password, is_password_hashed).result()
+        return api
+
+    def remove_account(self, name):
+        """
+        Remove an account, requests still pending for it are cancelled.
+        """
+        with self._cond:
+            account = self._accounts.pop(name)
+            self._cycle.remove(name)
+        for future, _, _, _ in account.pending:
+            future.cancel()
+
+    def api(self, name):
+        """
+        Get the API client of an account.
+        """
+        return self._accounts[name].api
+
+    @property
+    def accounts(self):
+        """
+        The names of all accounts.
+        """
+        return list(self._accounts)
+
+    def submit(self, name, method, *args, **kwargs):
+        """
+        Queue a request for an account.
+
+        Args:
+            name (str): Name of the account.
+            method (str or callable): Name of the API client method to call, or a callable
+                which is called with the API client as first argument.
+            *args, **kwargs: Arguments for the method.
+
+        Returns:
+            concurrent.futures.Future: Future resolving to the method result.
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("AccountManager is closed")
+            self._accounts[name].pending.append((future, method, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def map(self, method, *args, accounts=None, **kwargs):
+        """
+        Call the same method for several accounts and wait for all results.
+
+        Args:
+            method (str or callable): See submit().
+            accounts (list, optional): Names of the accounts. Defaults to all accounts.
+
+        Returns:
+            dict: Results keyed by account name, exceptions are returned in place of the result.
+        """
+        futures = {name: self.submit(name, method, *args, **kwargs)
+                   for name in (self.accounts if accounts is None else accounts)}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as error:
+                results[name] = error
+        return results
+
+    def close(self):
+        """
+        Stop the workers after the queued requests have been executed and close the connection pool.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            if worker is not threading.current_thread():
+                worker.join()
+        self.adapter.close()
+
+    def _next_job(self):
+        """
+        Take the next request in round-robin order, waiting while no account may send one.
+        Must be called holding self._cond. Returns None when the manager is closed and idle.
+        """
+        while True:
+            wait = None
+            has_pending = False
+            for _ in range(len(self._cycle)):
+                account = self._accounts[self._cycle[0]]
+                self._cycle.rotate(-1)
+                has_pending = has_pending or bool(account.pending)
+                if account.busy or not account.pending:
+                    continue
+                # Only started when a token is available, the session takes it with the first request
+                delay = 0 if account.limiter is None else account.limiter.delay()
+                if not delay:
+                    account.busy = True
+                    return account, account.pending.popleft()
+                wait = delay if wait is None else min(wait, delay)
+
+            if self._closed and not has_pending:
+                return None
+            self._cond.wait(wait)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+            if job is None:
+                return
+
+            account, (future, method, args, kwargs) = job
+            try:
+                if future.set_running_or_notify_cancel():
+                    self._run(account, future, method, args, kwargs)
+            finally:
+                with self._cond:
+                    account.busy = False
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _run(account, future, method, args, kwargs):
+        try:
+            if callable(method):
+                result = method(account.api, *args, **kwargs)
+            else:
+                result = getattr(account.api, method)(*args, **kwargs)
+        except BaseException as error:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
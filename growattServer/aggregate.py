@@ -0,0 +1,298 @@
+"""
+Incremental fleet, plant and device type totals of polled device data.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .open_api_v1 import DeviceType, OpenApiV1
+from .timeouts import in_context
+from .units import parse_value
+
+logger = logging.getLogger(__name__)
+
+# Metric -> device type -> fields summed into the metric, a field can be a (field, factor) tuple
+# to convert its unit. Power is in W, energy in kWh and soc in %, as returned by min_energy
+# (tlx_last_data), sph_energy (mix_last_data) and the ShinePhone tlx_system_status and
+# mix_system_status (power in kW).
+DEFAULT_METRICS = {
+    'pv_power': {
+        'min': ('ppv',),
+        'sph': ('ppv1', 'ppv2'),
+        'tlx': (('ppv', 1000),),
+        'mix': (('ppv', 1000),),
+    },
+    'grid_export_power': {
+        'min': ('pacToGridTotal',),
+        'sph': ('pactogrid',),
+        'tlx': (('pactogrid', 1000),),
+        'mix': (('pactogrid', 1000),),
+    },
+    'grid_import_power': {
+        'min': ('pacToUserTotal',),
+        'sph': ('pactouser',),
+        'tlx': (('pactouser', 1000),),
+        'mix': (('pactouser', 1000),),
+    },
+    'pv_energy_today': {
+        'min': ('epvToday',),
+        'sph': ('epv1Today', 'epv2Today'),
+    },
+}
+
+# Fields containing the battery state of charge in %, per device type
+DEFAULT_SOC_FIELDS = {
+    'min': 'bdc1Soc',
+    'sph': 'soc',
+    'tlx': 'SOC',
+    'mix': 'SOC',
+    'noah': 'soc',
+}
+
+
+class FleetAggregator:
+    """
+    Keep fleet, plant and device type totals of the latest data of every device up to date.
+
+    Every device contributes a fixed-order vector of metric values. When a new sample of a
+    device arrives only the difference with its previous vector is added to the totals of
+    the fleet, its plant and its device type, so an update costs the same regardless of
+    the size of the fleet. Every `recompute_every` updates the totals are recomputed from
+    the device vectors, so floating point errors of the deltas do not accumulate.
+
+    Besides the metrics, every total contains:
+        'devices' -- Number of devices
+        'battery_capacity' -- Summed capacity in kWh of the devices with a known capacity
+        'battery_energy' -- Energy stored in those batteries in kWh (SOC weighted capacity)
+        'battery_soc' -- battery_energy as a percentage of battery_capacity, None without capacity
+
+    Args:
+        metrics (dict, optional): Metric name -> device type -> fields summed into the metric.
+            Defaults to DEFAULT_METRICS.
+        soc_fields (dict, optional): Device type -> field with the SOC in %. Defaults to DEFAULT_SOC_FIELDS.
+        capacities (dict, optional): Device serial number -> battery capacity in kWh.
+        recompute_every (int): Recompute the totals from scratch every this many updates. Defaults to 10000.
+
+    Example:
+        aggregator = FleetAggregator(capacities={"DEVICE_SERIAL_NUMBER": 10.0})
+        aggregator.collect(api)
+        print(aggregator.totals()['fleet']['pv_power'])
+
+        # Or keep it updated from a poller
+        poller.run(aggregator.update_record)
+    """
+
+    def __init__(self, metrics=None, soc_fields=None, capacities=None, recompute_every=10000):
+        self.metrics = dict(metrics or DEFAULT_METRICS)
+        self.soc_fields = dict(soc_fields or DEFAULT_SOC_FIELDS)
+        self.capacities = dict(capacities or {})
+        self.recompute_every = recompute_every
+        self._updates = 0
+        self._names = list(self.metrics) + ['devices', 'battery_capacity', 'battery_energy']
+        # Device type -> tuple of field tuples, one per metric
+        self._fields = {}
+        # device_sn -> (plant_id, device_type, contribution vector)
+        self._devices = {}
+        # group key ('fleet', ('plant', plant_id) or ('device_type', device_type)) -> total vector
+        self._totals = {}
+        # plant_id -> plant_energy_overview values
+        self._plants = {}
+        # Serial numbers collect() skipped because of their type, logged once
+        self._skipped = set()
+        self._lock = threading.Lock()
+
+    def _device_fields(self, device_type):
+        fields = self._fields.get(device_type)
+        if fields is None:
+            if not any(device_type in types for types in self.metrics.values()):
+                logger.warning("No metrics defined for device type %s, its data is not summed", device_type)
+            fields = self._fields[device_type] = tuple(
+                tuple(field if isinstance(field, tuple) else (field, 1) for field in types.get(device_type, ()))
+                for types in self.metrics.values())
+        return fields
+
+    @staticmethod
+    def _number(value):
+        parsed = parse_value(value)
+        return parsed[0] if parsed else 0.0
+
+    def _contribution(self, device_sn, device_type, data):
+        vector = []
+        for fields in self._device_fields(device_type):
+            vector.append(sum((self._number(data.get(field)) * factor for field, factor in fields), 0.0))
+
+        capacity = self.capacities.get(device_sn)
+        soc_field = self.soc_fields.get(device_type)
+        soc = data.get(soc_field) if soc_field else None
+        if capacity and soc is not None:
+            vector.extend((1.0, capacity, self._number(soc) / 100 * capacity))
+        else:
+            vector.extend((1.0, 0.0, 0.0))
+        return vector
+
+    def _apply(self, plant_id, device_type, delta):
+        """
+        Add a delta vector to the totals of the fleet, a plant and a device type, with the lock held.
+        """
+        for key in ('fleet', ('plant', plant_id), ('device_type', device_type)):
+            total = self._totals.get(key)
+            if total is None:
+                self._totals[key] = list(delta)
+                continue
+            for index, value in enumerate(delta):
+                total[index] += value
+
+    def update(self, device_sn, device_type, data, plant_id=None):
+        """
+        Replace the contribution of a device with a new sample.
+
+        Args:
+            device_sn (str): The serial number of the device.
+            device_type (str): 'min', 'sph', 'tlx', 'mix' or 'noah', selects the fields of the metrics.
+            data (dict): The latest data of the device, e.g. from min_energy or sph_energy.
+            plant_id (optional): The plant of the device.
+        """
+        contribution = self._contribution(device_sn, device_type, data or {})
+        with self._lock:
+            previous = self._devices.get(device_sn)
+            if previous is not None and previous[:2] != (plant_id, device_type):
+                # The device moved to another plant, take it out of the old totals
+                self._apply(previous[0], previous[1], [-value for value in previous[2]])
+                previous = None
+            if previous is None:
+                delta = contribution
+            else:
+                delta = [new - old for new, old in zip(contribution, previous[2])]
+            self._devices[device_sn] = (plant_id, device_type, contribution)
+            self._apply(plant_id, device_type, delta)
+            self._updates += 1
+            if self.recompute_every and self._updates >= self.recompute_every:
+                self._recompute()
+
+    def _recompute(self):
+        """
+        Rebuild the totals from the device vectors, with the lock held.
+        """
+        self._totals = {}
+        self._updates = 0
+        for plant_id, device_type, contribution in self._devices.values():
+            self._apply(plant_id, device_type, contribution)
+
+    def recompute(self):
+        """
+        Recompute the totals from the latest data of every device, see the class documentation.
+        """
+        with self._lock:
+            self._recompute()
+
+    def update_record(self, record):
+        """
+        Update a device from a Poller record, records of failed polls are ignored.
+        """
+        if record.get('data') is not None:
+            self.update(record['device_sn'], record['device_type'], record['data'], record.get('plant_id'))
+
+    def update_plant(self, plant_id, overview):
+        """
+        Store the plant_energy_overview of a plant, see plant_totals().
+        """
+        values = {field: self._number(value) for field, value in (overview or {}).items()
+                  if field in ('current_power', 'today_energy', 'monthly_energy', 'yearly_energy', 'total_energy')}
+        with self._lock:
+            self._plants[plant_id] = values
+
+    def remove(self, device_sn):
+        """
+        Remove a device from all totals.
+        """
+        with self._lock:
+            previous = self._devices.pop(device_sn, None)
+            if previous is not None:
+                self._apply(previous[0], previous[1], [-value for value in previous[2]])
+
+    def _total(self, vector):
+        total = dict(zip(self._names, vector))
+        total['devices'] = int(round(total['devices']))
+        capacity = total['battery_capacity']
+        total['battery_soc'] = total['battery_energy'] / capacity * 100 if capacity else None
+        return total
+
+    def totals(self):
+        """
+        The current totals.
+
+        Returns:
+            dict: 'fleet' -> the fleet total, 'plants' -> plant_id -> total and
+                'device_types' -> device type -> total. See the class documentation for the fields.
+        """
+        with self._lock:
+            totals = {'fleet': self._total(self._totals.get('fleet', [0.0] * len(self._names))),
+                      'plants': {}, 'device_types': {}}
+            for key, vector in self._totals.items():
+                if key == 'fleet' or not round(vector[len(self.metrics)]):
+                    continue
+                group, name = key
+                totals['plants' if group == 'plant' else 'device_types'][name] = self._total(vector)
+        return totals
+
+    def plant_totals(self):
+        """
+        The summed plant_energy_overview values (current_power, today_energy, ...) of all plants
+        passed to update_plant().
+        """
+        with self._lock:
+            totals = {}
+            for values in self._plants.values():
+                for field, value in values.items():
+                    totals[field] = totals.get(field, 0.0) + value
+        return totals
+
+    def collect(self, api, device_sns=None, max_workers=4):
+        """
+        Fetch the latest data of all plants and MIN/SPH devices on an OpenApiV1 account and update the totals.
+
+        The device list and plant_energy_overview of every plant are fetched concurrently, then
+        the device data with device_energy_batch (100 devices per request), max_workers
+        requests at a time. Devices of other types (by the type in the device list) are skipped.
+
+        Args:
+            api (OpenApiV1): The API client.
+            device_sns (list, optional): Only collect these devices. Defaults to all MIN/SPH devices.
+            max_workers (int): Number of concurrent requests. Defaults to 4.
+
+        Returns:
+            dict: The totals, see totals().
+        """
+        plant_ids = [plant['plant_id'] for plant in (api.plant_list() or {}).get('plants', [])]
+
+        def fetch_plant(plant_id):
+            return api.device_list(plant_id), api.plant_energy_overview(plant_id)
+
+        wanted = set(device_sns) if device_sns is not None else None
+        device_plants = {}
+        device_types = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for plant_id, (device_data, overview) in zip(plant_ids, executor.map(in_context(fetch_plant), plant_ids)):
+                self.update_plant(plant_id, overview)
+                for device in (device_data or {}).get('devices', []):
+                    device_sn = device['device_sn']
+                    if wanted is not None and device_sn not in wanted:
+                        continue
+                    # The type from the device list, looking it up would walk every plant again
+                    try:
+                        device_type = DeviceType(int(device['type']))
+                    except (KeyError, ValueError, TypeError):
+                        device_type = None
+                    if device_type not in OpenApiV1._device_methods:
+                        if device_sn not in self._skipped:
+                            self._skipped.add(device_sn)
+                            logger.info("Skipping device %s of unsupported type %s", device_sn, device.get('type'))
+                        continue
+                    device_plants[device_sn] = plant_id
+                    device_types[device_sn] = device_type
+
+        energy = api.device_energy_batch(device_types, max_workers=max_workers)
+        for device_sn, data in energy.items():
+            if data is not None:
+                self.update(device_sn, device_types[device_sn].name.lower(), data, device_plants[device_sn])
+        return self.totals()
@@ -4,6 +4,12 @@ import requests
 from random import randint
 import warnings
 import hashlib
+import json
+import os
+import threading
+import time
+from .servers import DEFAULT_SERVERS, ServerSelector
+from .session import GrowattSession
 
 name = "growattServer"
 
@@ -32,6 +38,8 @@ class Timespan(IntEnum):
 class GrowattApi:
     server_url = 'https://openapi.growatt.com/'
     agent_identifier = "Dalvik/2.1.0 (Linux; U; Android 12; https://github.com/indykoning/PyPi_GrowattServer)"
+    # 'result'/'msg' values of a response meaning the session is not logged in (any value mentioning login also counts)
+    session_expired_codes = ('501', '502', '10011')
 
     def __init__(self, add_random_user_id=False, agent_identifier=None):
         if (agent_identifier != None):
@@ -43,7 +51,7 @@ class GrowattApi:
                                     for num in range(0, 5)])
             self.agent_identifier += " - " + random_number
 
-        self.session = requests.Session()
+        self.session = GrowattSession()
         self.session.hooks = {
             'response': lambda response, *args, **kwargs: response.raise_for_status()
         }
@@ -51,6 +59,23 @@ class GrowattApi:
         headers = {'User-Agent': self.agent_identifier}
         self.session.headers.update(headers)
 
+        # Details of the logged in user, set by login() and load_session()
+        self.user_id = None
+        self.user_level = None
+        self.login_data = None
+
+        # Log in again and replay the request when the login session expired, see login()
+        self.auto_relogin = True
+        self._credentials = None
+        self._last_login = None
+        self._relogin_lock = threading.Lock()
+        self.session.expired_session_handler = self._handle_expired_session
+
+        # Plants (e.g. tlx systems) whose devices are only listed by getAllDeviceList
+        self.all_device_list_plants = set()
+        # Number of plant_info requests skipped because of all_device_list_plants
+        self.device_list_requests_saved = 0
+
     def __get_date_string(self, timespan=None, date=None):
         if timespan is not None:
             assert timespan in Timespan
@@ -72,6 +97,36 @@ class GrowattApi:
         """
         return self.server_url + page
 
+    def _set_server_url(self, server_url):
+        """
+        Switch the client to another server.
+        """
+        self.server_url = server_url
+
+    def select_server(self, servers=None, probe_timeout=5.0, reprobe_interval=3600, failure_threshold=3):
+        """
+        Use the fastest healthy server out of a list of candidates, see ServerSelector.
+
+        The candidates are probed right away and again every reprobe_interval seconds, and
+        all requests of this client are sent to the selected server, failing over to the next
+        fastest one after failure_threshold consecutive failed requests.
+
+        Keyword arguments:
+        servers -- Candidate base URLs, all must serve the account (default: growattServer.servers.DEFAULT_SERVERS)
+        probe_timeout -- Seconds to wait for a probe response (default: 5)
+        reprobe_interval -- Seconds between probes of all candidates (default: 3600)
+        failure_threshold -- Consecutive failed requests that trigger a failover (default: 3)
+
+        Returns:
+        The ServerSelector, its current attribute is the selected base URL
+        """
+        selector = ServerSelector(servers or DEFAULT_SERVERS, probe_timeout=probe_timeout,
+                                  reprobe_interval=reprobe_interval, failure_threshold=failure_threshold,
+                                  on_change=self._set_server_url)
+        selector.probe()
+        self.session.server_selector = selector
+        return selector
+
     def login(self, username, password, is_password_hashed=False):
         """
         Log the user in.
@@ -138,7 +193,7 @@ class GrowattApi:
         response = self.session.post(self.get_url('newTwoLoginAPI.do'), data={
             'userName': username,
             'password': password
-        })
+        }, relogin=False)
 
         data = response.json()['back']
         if data['success']:
@@ -146,6 +201,206 @@ class GrowattApi:
                 'userId': data['user']['id'],
                 'userLevel': data['user']['rightlevel']
             })
+            self.user_id = data['userId']
+            self.user_level = data['userLevel']
+            self.login_data = data
+            # Remembered so an expired session can be renewed, see _handle_expired_session()
+            self._credentials = (username, password)
+            self._last_login = time.monotonic()
+        return data
+
+    def _is_session_expired(self, response):
+        """
+        Check whether a response means the login session has expired.
+
+        The server then redirects to the login page, serves that HTML page instead
+        of the JSON response or returns a result/msg code meaning "not logged in".
+        Endpoints often label JSON as text/html and an empty 'back' payload is normal
+        for plants without devices, so neither means the session expired on its own.
+        """
+        if response.is_redirect:
+            return 'login' in response.headers.get('Location', '').lower()
+
+        if response.history and 'login' in response.url.lower():
+            return True
+
+        try:
+            body = response.json()
+        except ValueError:
+            # Only an HTML page that is not JSON, the login page, replaces an expired response
+            return 'text/html' in response.headers.get('Content-Type', '') or self._is_login_page(response.text)
+
+        if not isinstance(body, dict):
+            return False
+        return self._is_not_logged_in(body) or (isinstance(body.get('back'), dict) and
+                                                self._is_not_logged_in(body['back']))
+
+    def _is_not_logged_in(self, payload):
+        """
+        Check whether the result/msg code of a JSON payload means "not logged in".
+        """
+        for key in ('result', 'msg'):
+            value = payload.get(key)
+            if value is None or isinstance(value, bool):
+                continue
+            value = str(value).strip().lower()
+            if value in self.session_expired_codes or 'login' in value:
+                return True
+        return False
+
+    @staticmethod
+    def _is_login_page(text):
+        text = text[:4096].lower()
+        return '<html' in text and 'login' in text
+
+    def _handle_expired_session(self, response, started):
+        """
+        Log in again when a request failed because the login session expired.
+
+        Concurrent callers share one lock, so only the first of them logs in and
+        the others reuse the new session.
+
+        Keyword arguments:
+        response -- The response of the request
+        started -- time.monotonic() value from before the request was sent
+
+        Returns:
+        True if the session was renewed and the request should be replayed
+        """
+        if not self.auto_relogin or self._credentials is None or not self._is_session_expired(response):
+            return False
+
+        with self._relogin_lock:
+            # Another caller already logged in again after this request was sent
+            if self._last_login is not None and self._last_login > started:
+                return True
+
+            username, password = self._credentials
+            return bool(self.login(username, password, is_password_hashed=True).get('success'))
+
+    def save_session(self, path, max_age=datetime.timedelta(hours=12)):
+        """
+        Save the logged in session to a credential cache file so other processes can reuse it.
+
+        The file contains the session cookies, the user id/level, the account name and the
+        server URL (not the password hash) and is only readable by the current user.
+
+        Keyword arguments:
+        path -- Path of the credential cache file
+        max_age -- How long the saved session may be reused (datetime.timedelta, default 12 hours)
+        """
+        if self.login_data is None:
+            raise ValueError("Not logged in, call login() before save_session()")
+
+        cache = {
+            'server_url': self.server_url,
+            'expires': time.time() + max_age.total_seconds(),
+            'userId': self.user_id,
+            'userLevel': self.user_level,
+            'accountName': (self.login_data.get('user') or {}).get('accountName'),
+            'cookies': [{
+                'name': cookie.name,
+                'value': cookie.value,
+                'domain': cookie.domain,
+                'path': cookie.path
+            } for cookie in self.session.cookies],
+        }
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # The mode of os.open only applies to new files
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as cache_file:
+            json.dump(cache, cache_file)
+
+    def load_session(self, path):
+        """
+        Restore a session saved by save_session().
+
+        Keyword arguments:
+        path -- Path of the credential cache file
+
+        Returns:
+        The saved part of the login response ('success', 'userId', 'userLevel' and 'user' with
+        'id', 'rightlevel' and 'accountName'), or None if there is no usable (unexpired) session in the file
+        """
+        try:
+            with open(path) as cache_file:
+                cache = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if cache.get('expires', 0) <= time.time():
+            return None
+
+        self._set_server_url(cache['server_url'])
+        self.user_id = cache['userId']
+        self.user_level = cache['userLevel']
+        self.login_data = {
+            'success': True,
+            'userId': self.user_id,
+            'userLevel': self.user_level,
+            'user': {'id': self.user_id, 'rightlevel': self.user_level, 'accountName': cache.get('accountName')},
+        }
+        for cookie in cache['cookies']:
+            self.session.cookies.set(cookie['name'], cookie['value'],
+                                     domain=cookie['domain'], path=cookie['path'])
+        return self.login_data
+
+    def is_session_valid(self):
+        """
+        Cheaply check whether the current session is still logged in.
+
+        An expired session is redirected to the login page instead of returning the plant list.
+
+        Returns:
+        True if the session can still be used, otherwise False
+        """
+        if self.user_id is None:
+            return False
+
+        try:
+            response = self.session.get(
+                self.get_url('PlantListAPI.do'),
+                params={'userId': self.user_id},
+                allow_redirects=False,
+                relogin=False
+            )
+            return response.status_code == 200 and 'back' in response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return False
+
+    def login_cached(self, username, password, path, is_password_hashed=False,
+                     max_age=datetime.timedelta(hours=12)):
+        """
+        Log the user in, reusing a session saved in the credential cache file when it is still valid.
+
+        Only when there is no saved session for this user, or it has expired, a full login is done
+        and the new session is saved for the next process.
+
+        Keyword arguments:
+        username -- The username
+        password -- The password
+        path -- Path of the credential cache file
+        is_password_hashed -- Whether password is already hashed with hash_password (default False)
+        max_age -- How long a new session may be reused (datetime.timedelta, default 12 hours)
+
+        Returns:
+        The login response, see login()
+        """
+        if not is_password_hashed:
+            password = hash_password(password)
+            is_password_hashed = True
+
+        data = self.load_session(path)
+        if data is not None and data.get('user', {}).get('accountName') == username and self.is_session_valid():
+            self._credentials = (username, password)
+            self._last_login = time.monotonic()
+            return data
+
+        self.session.cookies.clear()
+        data = self.login(username, password, is_password_hashed)
+        if data['success']:
+            self.save_session(path, max_age)
         return data
 
     def plant_list(self, user_id):
@@ -831,16 +1086,37 @@ class GrowattApi:
 
         return response.json().get('deviceList', {})
 
-    def device_list(self, plant_id):
+    def device_list(self, plant_id, use_all_devices=None):
         """
         Get a list of all devices connected to plant.
+
+        Plants for which plant_info returns no devices (e.g. tlx systems) are remembered
+        in all_device_list_plants, later calls for those plants skip the plant_info request.
+
+        Keyword arguments:
+        plant_id -- The id of the plant you want the devices of
+        use_all_devices -- Hint whether the plant needs the getAllDeviceList request (e.g. tlx systems).
+                           True skips plant_info, False always tries plant_info first,
+                           None uses what was learned from earlier calls (default None)
         """
+        if use_all_devices is None:
+            use_all_devices = plant_id in self.all_device_list_plants
+
+        if use_all_devices:
+            device_list = self.__get_all_devices(plant_id)
+            if device_list:
+                self.all_device_list_plants.add(plant_id)
+                self.device_list_requests_saved += 1
+                return device_list
+            self.all_device_list_plants.discard(plant_id)
 
         device_list = self.plant_info(plant_id).get('deviceList', [])
 
         if not device_list:
             # for tlx systems, the device_list in plant is empty, so use __get_all_devices() instead
             device_list = self.__get_all_devices(plant_id)
+            if device_list:
+                self.all_device_list_plants.add(plant_id)
 
         return device_list
 
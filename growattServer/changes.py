@@ -0,0 +1,95 @@
+"""
+Change detection between consecutive polls of a device.
+"""
+import threading
+
+
+class ChangeDetector:
+    """
+    Remember the last snapshot of every device and report only the fields that changed.
+
+    Numeric fields can have a deadband: a change is only reported once the value differs
+    from the last reported value by more than the deadband, so slow drifts are still
+    reported while noise is not. Every `keyframe_every` updates of a device a keyframe with
+    all fields is produced, so consumers can (re)build the full state from the stream.
+
+    Args:
+        deadbands (dict, optional): Maps field names to the minimum absolute change of their
+            numeric value that is reported, e.g. {'ppv': 10, 'soc': 1}.
+        keyframe_every (int): Produce a keyframe every this many updates of a device,
+            0 to only produce the first keyframe. Defaults to 12 (one hour of 5 minute polls).
+
+    Example:
+        detector = ChangeDetector(deadbands={'ppv': 10})
+        delta = detector.update("DEVICE_SERIAL_NUMBER", api.min_detail("DEVICE_SERIAL_NUMBER"))
+        if delta['changes'] or delta['removed']:
+            publish(delta)
+    """
+
+    def __init__(self, deadbands=None, keyframe_every=12):
+        self.deadbands = dict(deadbands or {})
+        self.keyframe_every = keyframe_every
+        # device_sn -> (last reported snapshot, updates since the last keyframe)
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def _changed(self, field, old, new):
+        deadband = self.deadbands.get(field)
+        if deadband is not None:
+            try:
+                return abs(float(new) - float(old)) > deadband
+            except (TypeError, ValueError):
+                pass
+        return old != new
+
+    def update(self, device_sn, snapshot):
+        """
+        Compare a new snapshot of a device with the last one.
+
+        Args:
+            device_sn (str): The serial number of the device.
+            snapshot (dict): The full data of the device.
+
+        Returns:
+            dict: A dictionary containing:
+                - keyframe (bool): Whether changes contains all fields of the snapshot
+                - changes (dict): The fields that changed (all fields for a keyframe)
+                - removed (list): Fields of the previous snapshot missing in this one
+        """
+        snapshot = snapshot or {}
+        with self._lock:
+            last, updates = self._state.get(device_sn, (None, 0))
+            keyframe = last is None or (self.keyframe_every and updates + 1 >= self.keyframe_every)
+
+            if keyframe:
+                self._state[device_sn] = (dict(snapshot), 0)
+                return {'keyframe': True, 'changes': dict(snapshot), 'removed': []}
+
+            changes = {field: value for field, value in snapshot.items()
+                       if field not in last or self._changed(field, last[field], value)}
+            removed = [field for field in last if field not in snapshot]
+
+            # Keep the last reported value of fields within their deadband
+            reported = {field: last[field] for field in snapshot if field in last}
+            reported.update(changes)
+            self._state[device_sn] = (reported, updates + 1)
+
+        return {'keyframe': False, 'changes': changes, 'removed': removed}
+
+    def force_keyframe(self, device_sn=None):
+        """
+        Make the next update of a device (or of all devices when device_sn is None) a keyframe.
+        """
+        with self._lock:
+            if device_sn is None:
+                self._state.clear()
+            else:
+                self._state.pop(device_sn, None)
+
+    def snapshot(self, device_sn):
+        """
+        The state a consumer of the deltas of a device has rebuilt, None if the device is unknown.
+        """
+        with self._lock:
+            state = self._state.get(device_sn)
+        return dict(state[0]) if state else None
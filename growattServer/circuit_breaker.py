@@ -0,0 +1,143 @@
+"""
+Circuit breaker protecting callers from Growatt server outages.
+"""
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+
+from .exceptions import GrowattCircuitOpenError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _Circuit:
+    def __init__(self, window):
+        self.results = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = None
+        self.trials = 0
+
+
+class CircuitBreaker:
+    """
+    Fail fast while an endpoint or a whole host of the Growatt server is failing.
+
+    Each endpoint (URL path plus 'op' parameter) and each host has its own circuit. A circuit
+    opens once at least `min_requests` of its last `window` requests were made and
+    `failure_rate` of them failed (connection errors, timeouts and 5XX responses). While a
+    circuit is open, requests raise GrowattCircuitOpenError without being sent. After
+    `reset_timeout` seconds the circuit is half-open and lets `half_open_requests` trial
+    requests through: a success closes it, a failure opens it again.
+
+    Assign it to the session of one or more API clients:
+        api.session.circuit_breaker = growattServer.CircuitBreaker()
+
+    Args:
+        failure_rate (float): Fraction of failed requests that opens a circuit. Defaults to 0.5.
+        min_requests (int): Minimum number of requests in the window before a circuit opens. Defaults to 10.
+        window (int): Number of most recent requests the failure rate is computed over. Defaults to 20.
+        reset_timeout (float): Seconds a circuit stays open before trial requests are let through. Defaults to 30.
+        half_open_requests (int): Number of concurrent trial requests while half-open. Defaults to 1.
+    """
+
+    def __init__(self, failure_rate=0.5, min_requests=10, window=20, reset_timeout=30.0, half_open_requests=1):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_requests = half_open_requests
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def keys(url, params=None):
+        """
+        The (host, endpoint) circuit keys of a request.
+        """
+        parts = urlsplit(url)
+        endpoint = parts.path
+        op = (params or {}).get('op') if isinstance(params, dict) else None
+        if op:
+            endpoint = f"{endpoint}?op={op}"
+        return parts.netloc, endpoint
+
+    def _circuit(self, key):
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit(self.window)
+        return circuit
+
+    def state(self, host, endpoint=None):
+        """
+        The state of the circuit of a host, or of an endpoint on it: 'closed', 'open' or 'half_open'.
+        """
+        with self._lock:
+            circuit = self._circuits.get((host, endpoint))
+            if circuit is None:
+                return CLOSED
+            if circuit.state == OPEN and time.monotonic() - circuit.opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return circuit.state
+
+    def acquire(self, host, endpoint):
+        """
+        Check whether a request may be sent, call record() with its outcome afterwards.
+
+        Raises:
+            GrowattCircuitOpenError: If the circuit of the host or endpoint is open.
+        """
+        now = time.monotonic()
+        with self._lock:
+            circuits = [self._circuit((host, None)), self._circuit((host, endpoint))]
+            for circuit in circuits:
+                if circuit.state == OPEN and now - circuit.opened_at >= self.reset_timeout:
+                    circuit.state = HALF_OPEN
+                    circuit.trials = 0
+
+            for circuit in circuits:
+                if circuit.state == OPEN or (circuit.state == HALF_OPEN and
+                                             circuit.trials >= self.half_open_requests):
+                    retry_after = max(0.0, self.reset_timeout - (now - (circuit.opened_at or now)))
+                    raise GrowattCircuitOpenError(
+                        f"Circuit breaker open for {host}{endpoint or ''}, not sending request",
+                        host=host, endpoint=endpoint, retry_after=retry_after)
+
+            for circuit in circuits:
+                if circuit.state == HALF_OPEN:
+                    circuit.trials += 1
+
+    def record(self, host, endpoint, success):
+        """
+        Record the outcome of a request allowed by acquire().
+        """
+        now = time.monotonic()
+        with self._lock:
+            for circuit in (self._circuit((host, None)), self._circuit((host, endpoint))):
+                if circuit.state == HALF_OPEN:
+                    circuit.trials = max(0, circuit.trials - 1)
+                    circuit.results.clear()
+                    if success:
+                        circuit.state = CLOSED
+                    else:
+                        circuit.state, circuit.opened_at = OPEN, now
+                    continue
+
+                circuit.results.append(success)
+                failures = circuit.results.count(False)
+                if (circuit.state == CLOSED and len(circuit.results) >= self.min_requests and
+                        failures >= self.failure_rate * len(circuit.results)):
+                    circuit.state, circuit.opened_at = OPEN, now
+
+    @staticmethod
+    def is_failure(error):
+        """
+        Whether a requests exception means the server is failing (as opposed to e.g. a 4XX response).
+        """
+        if isinstance(error, requests.exceptions.HTTPError):
+            return error.response is None or error.response.status_code >= 500
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
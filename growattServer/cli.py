@@ -0,0 +1,231 @@
+"""
+Command line interface of the growattServer library, run with `python -m growattServer`.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+
+from .base_api import GrowattApi
+from .changes import ChangeDetector
+from .open_api_v1 import OpenApiV1
+from .export import HistoryExporter
+from .poller import AdaptivePoller, Poller
+from .sinks import FileSink, MqttSink, SinkPipeline, StdoutSink
+
+
+def _add_account_arguments(parser):
+    account = parser.add_argument_group('account')
+    account.add_argument('--token', default=os.environ.get('GROWATT_TOKEN'),
+                         help="OpenAPI V1 token (default: $GROWATT_TOKEN)")
+    account.add_argument('--username', default=os.environ.get('GROWATT_USERNAME'),
+                         help="ShinePhone username (default: $GROWATT_USERNAME)")
+    account.add_argument('--password', default=os.environ.get('GROWATT_PASSWORD'),
+                         help="ShinePhone password (default: $GROWATT_PASSWORD)")
+    account.add_argument('--session-cache',
+                         help="File to save the ShinePhone login session in and reuse it from")
+    account.add_argument('--server-url', help="Growatt server URL, e.g. https://openapi-us.growatt.com/")
+    account.add_argument('--select-server', nargs='*', metavar='URL',
+                         help="Use the fastest of these server URLs (default: all regional servers), "
+                              "failing over when it errors")
+
+
+def _create_api(args):
+    """
+    Create a (logged in) API client from the account arguments.
+    """
+    if args.token:
+        api = OpenApiV1(args.token)
+        if args.server_url:
+            api._set_server_url(args.server_url)
+        if args.select_server is not None:
+            api.select_server(args.select_server)
+        return api
+
+    if not args.username or not args.password:
+        raise SystemExit("Either --token or --username and --password are required")
+
+    api = GrowattApi()
+    if args.server_url:
+        api._set_server_url(args.server_url)
+    if args.select_server is not None:
+        api.select_server(args.select_server)
+    if args.session_cache:
+        login = api.login_cached(args.username, args.password, args.session_cache)
+    else:
+        login = api.login(args.username, args.password)
+    if not login.get('success'):
+        raise SystemExit(f"Login failed: {login.get('msg', 'unknown error')}")
+    return api
+
+
+def _create_sink(args):
+    if args.mqtt:
+        host, _, port = args.mqtt.partition(':')
+        return MqttSink(host, int(port or 1883), topic=args.mqtt_topic,
+                        username=os.environ.get('MQTT_USERNAME'), password=os.environ.get('MQTT_PASSWORD'))
+    if args.output is None or args.output == '-':
+        return StdoutSink()
+    return FileSink(args.output)
+
+
+def _stop_on_signals(stop_event):
+    def stop(signum, frame):
+        stop_event.set()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+
+def poll(args):
+    """
+    Poll all devices and write every record as a JSON line.
+    """
+    if args.backpressure == 'spill' and not args.spill_file:
+        raise SystemExit("--backpressure spill requires --spill-file")
+    api = _create_api(args)
+    interval = args.interval
+    if args.type_interval:
+        interval = {device_type: float(seconds) for device_type, seconds in
+                    (item.split('=', 1) for item in args.type_interval)}
+    poller_class = AdaptivePoller if args.align_uploads else Poller
+    poller = poller_class(api, interval=interval, jitter=args.jitter, max_workers=args.workers,
+                          rate=args.rate, device_sns=args.device,
+                          rediscover_interval=args.rediscover_interval)
+    poller.default_interval = args.interval
+
+    stop_event = threading.Event()
+    _stop_on_signals(stop_event)
+
+    detector = None
+    if args.changes_only:
+        detector = ChangeDetector(deadbands={field: float(value) for field, value in
+                                             (item.split('=', 1) for item in args.deadband or [])},
+                                  keyframe_every=args.keyframe_every)
+
+    with SinkPipeline(_create_sink(args), max_queue=args.queue_size, flush_interval=args.flush_interval,
+                      policy=args.backpressure, spill_path=args.spill_file) as pipeline:
+        def write(record):
+            if detector is not None and record['data'] is not None:
+                delta = detector.update(record['device_sn'], record['data'])
+                if not (delta['keyframe'] or delta['changes'] or delta['removed']):
+                    return
+                record.update(data=delta['changes'], keyframe=delta['keyframe'], removed=delta['removed'])
+            pipeline.put(record)
+        poller.run(write, stop_event=stop_event, max_polls=args.count)
+
+
+def export(args):
+    """
+    Export the history of devices and plants between two dates.
+    """
+    api = _create_api(args)
+    if not isinstance(api, OpenApiV1):
+        raise SystemExit("Exporting history requires an OpenAPI V1 --token")
+
+    if args.format == 'csv' and (args.plants or (args.device and args.plant)):
+        raise SystemExit("Devices and plants can not be exported to the same CSV file, "
+                         "export plants with --plant to a separate --output")
+
+    device_sns = args.device or []
+    plant_ids = args.plant or []
+    if not device_sns and not plant_ids:
+        device_sns = [device_sn for device_sn, device_type in api.refresh_device_types().items()
+                      if device_type in OpenApiV1._device_methods]
+        if args.plants:
+            plant_ids = [plant['plant_id'] for plant in (api.plant_list() or {}).get('plants', [])]
+    elif args.plants:
+        raise SystemExit("--plants can not be combined with --device or --plant")
+
+    exporter = HistoryExporter(api, args.output, output_format=args.format, checkpoint=args.checkpoint,
+                               window_days=args.window_days, max_workers=args.workers,
+                               rate=args.rate)
+    summary = exporter.export(args.start, args.end, device_sns=device_sns, plant_ids=plant_ids)
+    print(json.dumps(summary), file=sys.stderr)
+    if summary['failed']:
+        raise SystemExit(1)
+
+
+def _date(value):
+    return datetime.date.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m growattServer',
+                                     description="Tools for the Growatt server API")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log progress to stderr")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    poll_parser = commands.add_parser('poll', help="Poll all devices and write the data as JSON Lines")
+    _add_account_arguments(poll_parser)
+    poll_parser.add_argument('--interval', type=float, default=300,
+                             help="Seconds between polls of a device (default: 300)")
+    poll_parser.add_argument('--type-interval', action='append', metavar='TYPE=SECONDS',
+                             help="Poll interval for a device type, e.g. noah=60 (repeatable)")
+    poll_parser.add_argument('--jitter', type=float, default=30,
+                             help="Maximum random shift of every poll in seconds (default: 30)")
+    poll_parser.add_argument('--workers', type=int, default=4,
+                             help="Number of concurrent polls (default: 4)")
+    poll_parser.add_argument('--rate', type=float,
+                             help="Maximum number of requests per minute (default: no limit)")
+    poll_parser.add_argument('--device', action='append', metavar='SERIAL',
+                             help="Only poll this device (repeatable)")
+    poll_parser.add_argument('--rediscover-interval', type=float, default=3600,
+                             help="Seconds between device discoveries (default: 3600)")
+    poll_parser.add_argument('--align-uploads', action='store_true',
+                             help="Poll shortly after each device's expected upload and back off on lost devices")
+    poll_parser.add_argument('--changes-only', action='store_true',
+                             help="Only write the fields that changed since the previous poll, plus periodic keyframes")
+    poll_parser.add_argument('--deadband', action='append', metavar='FIELD=VALUE',
+                             help="With --changes-only, ignore numeric changes of FIELD up to VALUE (repeatable)")
+    poll_parser.add_argument('--keyframe-every', type=int, default=12,
+                             help="With --changes-only, write all fields every this many polls of a device (default: 12)")
+    poll_parser.add_argument('--count', type=int, help="Stop after this many polls")
+    poll_parser.add_argument('--output', '-o', help="File to append the records to (default: stdout)")
+    poll_parser.add_argument('--mqtt', metavar='HOST[:PORT]',
+                             help="Publish the records to an MQTT broker instead (requires paho-mqtt, "
+                                  "credentials from MQTT_USERNAME/MQTT_PASSWORD)")
+    poll_parser.add_argument('--mqtt-topic', default='growatt/{device_sn}',
+                             help="MQTT topic, formatted with the record fields (default: growatt/{device_sn})")
+    poll_parser.add_argument('--flush-interval', type=float, default=5,
+                             help="Maximum seconds records are buffered before they are written (default: 5)")
+    poll_parser.add_argument('--queue-size', type=int, default=1000,
+                             help="Maximum number of records buffered for a slow output (default: 1000)")
+    poll_parser.add_argument('--backpressure', choices=SinkPipeline.policies, default='block',
+                             help="What to do when the buffer is full: wait, drop the oldest records or "
+                                  "spill them to --spill-file (default: block)")
+    poll_parser.add_argument('--spill-file', help="File records are spilled to with --backpressure spill")
+    poll_parser.set_defaults(func=poll)
+
+    export_parser = commands.add_parser('export', help="Export device and plant history (OpenAPI V1)")
+    _add_account_arguments(export_parser)
+    export_parser.add_argument('--start', type=_date, required=True, help="First day to export (YYYY-MM-DD)")
+    export_parser.add_argument('--end', type=_date, default=datetime.date.today(),
+                               help="Last day to export (YYYY-MM-DD, default: today)")
+    export_parser.add_argument('--device', action='append', metavar='SERIAL',
+                               help="Export this MIN/SPH device (repeatable, default: all devices)")
+    export_parser.add_argument('--plant', action='append', metavar='PLANT_ID',
+                               help="Export plant_energy_history of this plant (repeatable)")
+    export_parser.add_argument('--plants', action='store_true',
+                               help="Also export plant_energy_history of all plants")
+    export_parser.add_argument('--format', choices=sorted(HistoryExporter.writers), default='jsonl',
+                               help="Output format (default: jsonl)")
+    export_parser.add_argument('--output', '-o', required=True,
+                               help="Output file, or directory for parquet")
+    export_parser.add_argument('--checkpoint',
+                               help="Checkpoint file of exported windows (default: OUTPUT.checkpoint)")
+    export_parser.add_argument('--window-days', type=int, default=7,
+                               help="Days per request window, at most 7 (default: 7)")
+    export_parser.add_argument('--workers', type=int, default=4,
+                               help="Number of windows fetched concurrently (default: 4)")
+    export_parser.add_argument('--rate', type=float,
+                               help="Maximum number of requests per minute (default: no limit)")
+    export_parser.set_defaults(func=export)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args.func(args)
@@ -0,0 +1,243 @@
+"""
+Sharing the data of a device between many consumers with a single fetch per interval.
+"""
+import datetime
+import logging
+import threading
+import time
+
+from .open_api_v1 import OpenApiV1
+from .poller import Poller
+
+logger = logging.getLogger(__name__)
+
+
+class DataUpdateCoordinator:
+    """
+    Fetch the data of a device at most once per interval and notify subscribers of the fields they use.
+
+    Any number of consumers (e.g. the sensors of an inverter) read the shared data with get()
+    or subscribe to fields. Calls within the interval return the data of the last fetch,
+    concurrent calls when the data is stale wait for the same fetch. After every fetch only
+    subscribers of a field that changed are notified.
+
+    A failed fetch is logged and keeps the previous data, it is retried after
+    retry_interval seconds instead of on every call.
+
+    Args:
+        fetch (callable): Called without arguments to fetch the data, must return a dict.
+        interval (float): Seconds the data is considered fresh. Defaults to 300.
+        retry_interval (float): Seconds before a failed fetch is retried. Defaults to 60.
+        name (str, optional): Name used in log messages, e.g. the serial number.
+
+    Example:
+        coordinator = DataUpdateCoordinator.for_device(api, "DEVICE_SERIAL_NUMBER", interval=300)
+        coordinator.subscribe(lambda data, changed: print(changed), fields=('ppv', 'bdc1Soc'))
+        coordinator.start()
+        ...
+        coordinator.get('pac')
+        print(coordinator.last_refresh)
+    """
+
+    def __init__(self, fetch, interval=300, retry_interval=60, name=None):
+        self.fetch = fetch
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.name = name or getattr(fetch, '__name__', 'coordinator')
+        self.data = None
+        # datetime (UTC) of the last successful refresh
+        self.last_refresh = None
+        self.last_error = None
+        self.fetch_count = 0
+
+        # time.monotonic() of the next fetch, None to fetch on the next call
+        self._next_fetch = None
+        self._subscribers = []
+        # Held while fetching so concurrent callers wait for the same fetch, subscribers are
+        # notified after it is released
+        self._lock = threading.Lock()
+        # Held while notifying, taken before the fetch lock is released so the notifications of
+        # consecutive refreshes are delivered in order. Reentrant so subscribers can refresh.
+        self._notify_lock = threading.RLock()
+        self._stop_event = None
+        self._thread = None
+
+    @classmethod
+    def for_device(cls, api, device_sn, plant_id=None, device_type=None, operation='energy', **kwargs):
+        """
+        Create a coordinator for the current data of a device, fetched like Poller does.
+
+        Args:
+            api (GrowattApi): Logged in GrowattApi or OpenApiV1 client.
+            device_sn (str): The serial number of the device.
+            plant_id (optional): The plant of the device, required for ShinePhone tlx and mix devices.
+            device_type (str, optional): 'tlx', 'mix' or 'noah', required for ShinePhone devices.
+            operation (str): 'energy' (device_energy) or 'detail' (device_detail) for OpenApiV1.
+                Defaults to 'energy'.
+            **kwargs: interval, retry_interval, see the class documentation.
+        """
+        if isinstance(api, OpenApiV1):
+            method = getattr(api, f'device_{operation}')
+
+            def fetch():
+                return method(device_sn)
+        else:
+            if device_type not in Poller.shinephone_device_types:
+                raise ValueError(f"device_type must be one of {', '.join(Poller.shinephone_device_types)}")
+            device = {'device_sn': device_sn, 'plant_id': plant_id, 'device_type': device_type}
+
+            def fetch():
+                return Poller.fetch_shinephone(api, device)
+
+        kwargs.setdefault('name', device_sn)
+        return cls(fetch, **kwargs)
+
+    @property
+    def last_update_success(self):
+        """
+        Whether the last fetch succeeded.
+        """
+        return self.last_refresh is not None and self.last_error is None
+
+    def subscribe(self, callback, fields=None):
+        """
+        Call callback(data, changed) after every refresh that changed one of the fields.
+
+        changed is the set of subscribed fields that changed (added, removed or a different
+        value). The first successful refresh notifies every subscriber. Subscribers are called
+        from the refreshing thread after the new data is stored, without blocking readers, and
+        the notifications of consecutive refreshes are delivered in order.
+
+        Args:
+            callback (callable): Called with the data and the changed fields.
+            fields (iterable, optional): The fields the subscriber uses. Defaults to all fields.
+
+        Returns:
+            callable: Removes the subscription when called.
+        """
+        subscriber = (callback, frozenset(fields) if fields is not None else None)
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+        def unsubscribe():
+            with self._lock:
+                if subscriber in self._subscribers:
+                    self._subscribers.remove(subscriber)
+        return unsubscribe
+
+    def refresh(self, force=False):
+        """
+        Fetch the data unless it is still fresh (or a failed fetch is not due for a retry).
+
+        Args:
+            force (bool): Fetch even when the data is fresh.
+
+        Returns:
+            bool: Whether the data is from a successful fetch.
+        """
+        if not force and self._fresh():
+            return self.last_update_success
+        with self._lock:
+            # Another thread may have fetched while this one waited for the lock
+            if not force and self._fresh():
+                return self.last_update_success
+            notifications = self._refresh()
+            if notifications is None:
+                return False
+            # Wait for the notifications of an earlier refresh before this one's are delivered
+            self._notify_lock.acquire()
+        # Outside the fetch lock, so a slow subscriber does not stall other threads reading the data
+        try:
+            data, notifications = notifications
+            for callback, subscribed in notifications:
+                try:
+                    callback(data, subscribed)
+                except Exception:
+                    logger.exception("Subscriber of %s failed", self.name)
+        finally:
+            self._notify_lock.release()
+        return True
+
+    def _refresh(self):
+        """
+        Fetch the data, with the lock held.
+
+        Returns:
+            tuple: The data and the (callback, changed fields) to notify, None when the fetch failed.
+        """
+        self.fetch_count += 1
+        try:
+            data = self.fetch() or {}
+        except Exception as error:
+            logger.warning("Refreshing %s failed: %s", self.name, error)
+            self.last_error = error
+            self._next_fetch = time.monotonic() + self.retry_interval
+            return None
+
+        self._next_fetch = time.monotonic() + self.interval
+        self.last_error = None
+        self.last_refresh = datetime.datetime.now(datetime.timezone.utc)
+        previous, self.data = self.data, data
+        if previous is None:
+            changed = None
+        else:
+            changed = {field for field in previous.keys() | data.keys()
+                       if field not in previous or field not in data or previous[field] != data[field]}
+            if not changed:
+                return data, []
+        return data, self._notifications(data, changed)
+
+    def _fresh(self):
+        return self._next_fetch is not None and time.monotonic() < self._next_fetch
+
+    def _notifications(self, data, changed):
+        """
+        The subscribers of the changed fields (None for all fields) and their changed fields, with the lock held.
+        """
+        notifications = []
+        for callback, fields in self._subscribers:
+            if changed is None:
+                subscribed = set(data) if fields is None else set(fields)
+            else:
+                subscribed = changed if fields is None else changed & fields
+                if not subscribed:
+                    continue
+            notifications.append((callback, subscribed))
+        return notifications
+
+    def get(self, field, default=None):
+        """
+        The value of a field, refreshing the data first when it is stale.
+        """
+        self.refresh()
+        data = self.data
+        return data.get(field, default) if data is not None else default
+
+    def run(self, stop_event=None):
+        """
+        Refresh the data every interval until stop_event is set.
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.refresh()
+            stop_event.wait(max(self._next_fetch - time.monotonic(), 0))
+
+    def start(self):
+        """
+        Refresh the data in a background thread, see run().
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self.run, args=(self._stop_event,),
+                                        name=f'growatt-coordinator-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread started with start().
+        """
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
@@ -31,3 +31,18 @@ class GrowattV1ApiError(GrowattError):
         super().__init__(message)
         self.error_code = error_code
         self.error_msg = error_msg
+
+
+class GrowattCircuitOpenError(GrowattError):
+    """Raised without sending the request while the circuit breaker of an endpoint or host is open."""
+
+    def __init__(self, message, host=None, endpoint=None, retry_after=None):
+        super().__init__(message)
+        self.host = host
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class GrowattDeadlineExceededError(GrowattError):
+    """Raised when the time budget of a deadline() block is used up before or during a request."""
+    pass
@@ -0,0 +1,280 @@
+"""
+Bulk export of OpenAPI V1 history data.
+"""
+import csv
+import datetime
+import itertools
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .rate_limit import RateLimiter
+from .timeouts import in_context
+
+logger = logging.getLogger(__name__)
+
+
+class _JsonLinesWriter:
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, key, rows):
+        for row in rows:
+            self.file.write(json.dumps(row, default=str) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _CsvWriter:
+    """
+    Appends rows to a CSV file. The columns are taken from the existing file header or the
+    first rows written, fields that are not a column are left out.
+    """
+
+    def __init__(self, path):
+        self.fieldnames = None
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, newline='', encoding='utf-8') as existing:
+                self.fieldnames = next(csv.reader(existing), None)
+        self.file = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = None
+        self._ignored = set()
+
+    def write(self, key, rows):
+        if not rows:
+            return
+        if self.fieldnames is None:
+            fieldnames = list(HistoryExporter.key_fields)
+            for row in rows:
+                fieldnames.extend(field for field in row if field not in fieldnames)
+            self.fieldnames = fieldnames
+            self.writer = csv.DictWriter(self.file, self.fieldnames, extrasaction='ignore')
+            self.writer.writeheader()
+        elif self.writer is None:
+            self.writer = csv.DictWriter(self.file, self.fieldnames, extrasaction='ignore')
+
+        for row in rows:
+            ignored = set(row) - set(self.fieldnames) - self._ignored
+            if ignored:
+                logger.warning("Fields not in the CSV header are not exported: %s", ", ".join(sorted(ignored)))
+                self._ignored |= ignored
+            self.writer.writerow({field: json.dumps(value) if isinstance(value, (dict, list)) else value
+                                  for field, value in row.items()})
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    """
+    Writes every exported window to its own file in the output directory.
+    """
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet export requires pyarrow, install it with `pip install pyarrow`")
+        self.pyarrow = pyarrow
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, key, rows):
+        if not rows:
+            return
+        columns = {}
+        for row in rows:
+            for field in row:
+                columns.setdefault(field, None)
+        table = self.pyarrow.Table.from_pylist(
+            [{field: None if row.get(field) is None else str(row.get(field)) for field in columns} for row in rows])
+        file_name = key.replace(':', '_').replace('/', '_') + '.parquet'
+        self.pyarrow.parquet.write_table(table, os.path.join(self.path, file_name))
+
+    def close(self):
+        pass
+
+
+class HistoryExporter:
+    """
+    Export the history of many devices and plants over a long date range.
+
+    The date range is split into windows the history endpoints accept (7 days). Windows are
+    fetched concurrently, page by page, within an optional rate limit. Every finished
+    (device, window) pair is recorded in a checkpoint file, so an interrupted export
+    continues where it stopped when it is run again with the same checkpoint.
+
+    Every exported row is the history entry with these fields added:
+        'source' -- 'device' or 'plant'
+        'id' -- The device serial number or plant ID
+        'window_start', 'window_end' -- The window the row was fetched in
+
+    Args:
+        api (OpenApiV1): The API client.
+        output (str): Output file, or directory for parquet.
+        output_format (str): 'csv', 'jsonl' or 'parquet'. Defaults to 'jsonl'.
+        checkpoint (str, optional): Checkpoint file. Defaults to the output path with '.checkpoint' appended.
+        window_days (int): Number of days per request window, at most 7. Defaults to 7.
+        max_workers (int): Number of windows fetched concurrently. Defaults to 4.
+        rate (float, optional): Maximum number of requests per `per` seconds, None for no limit.
+        per (float): Length of the rate window in seconds. Defaults to 60.
+        page_size (int): Rows requested per page, at most 100. Defaults to 100.
+    """
+
+    key_fields = ('source', 'id', 'window_start', 'window_end')
+
+    writers = {
+        'csv': _CsvWriter,
+        'jsonl': _JsonLinesWriter,
+        'parquet': _ParquetWriter,
+    }
+
+    def __init__(self, api, output, output_format='jsonl', checkpoint=None, window_days=7,
+                 max_workers=4, rate=None, per=60.0, page_size=100):
+        if output_format not in self.writers:
+            raise ValueError(f"output_format must be one of {', '.join(self.writers)}")
+        if not 1 <= window_days <= 7:
+            raise ValueError("window_days must be between 1 and 7")
+
+        self.api = api
+        self.output = output
+        self.output_format = output_format
+        self.checkpoint = checkpoint or f"{output.rstrip(os.sep)}.checkpoint"
+        self.window_days = window_days
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(rate, per=per) if rate else None
+        self.page_size = page_size
+
+    def windows(self, start_date, end_date):
+        """
+        Split a date range (both inclusive) into request windows.
+
+        Returns:
+            list: (window_start, window_end) date tuples.
+        """
+        windows = []
+        while start_date <= end_date:
+            window_end = min(end_date, start_date + datetime.timedelta(days=self.window_days - 1))
+            windows.append((start_date, window_end))
+            start_date = window_end + datetime.timedelta(days=1)
+        return windows
+
+    def _completed(self):
+        try:
+            with open(self.checkpoint, encoding='utf-8') as checkpoint:
+                return {line.strip() for line in checkpoint if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def _request(self, method, *args, **kwargs):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        return method(*args, **kwargs)
+
+    def _fetch(self, source, target_id, window_start, window_end):
+        """
+        Fetch all pages of one window.
+        """
+        rows = []
+        page = 1
+        while True:
+            if source == 'device':
+                data = self._request(self.api.device_history, target_id, start_date=window_start,
+                                     end_date=window_end, page=page, limit=self.page_size) or {}
+                page_rows = data.get('datas', [])
+            else:
+                data = self._request(self.api.plant_energy_history, target_id, start_date=window_start,
+                                     end_date=window_end, time_unit='day', page=page,
+                                     perpage=self.page_size) or {}
+                page_rows = data.get('energys', [])
+
+            rows.extend(page_rows)
+            count = data.get('count')
+            if len(page_rows) < self.page_size or (count is not None and len(rows) >= int(count)):
+                break
+            page += 1
+
+        for row in rows:
+            row.update({
+                'source': source,
+                'id': target_id,
+                'window_start': window_start.isoformat(),
+                'window_end': window_end.isoformat(),
+            })
+        return rows
+
+    def export(self, start_date, end_date, device_sns=(), plant_ids=()):
+        """
+        Export the history of devices and plants between two dates (both inclusive).
+
+        Args:
+            start_date (date): First day to export.
+            end_date (date): Last day to export.
+            device_sns (list): Serial numbers of MIN/SPH devices to export.
+            plant_ids (list): IDs of plants to export plant_energy_history for.
+
+        Returns:
+            dict: 'exported' (windows exported now), 'skipped' (windows already in the
+                checkpoint), 'failed' (windows that failed) and 'rows' (rows written).
+
+        Raises:
+            ValueError: If devices and plants are exported to the same CSV file.
+        """
+        if self.output_format == 'csv' and device_sns and plant_ids:
+            # The CSV columns are fixed by the first rows, plant rows would lose their fields
+            raise ValueError("Devices and plants can not be exported to the same CSV file, "
+                             "export them to separate files")
+
+        completed = self._completed()
+        summary = {'exported': 0, 'skipped': 0, 'failed': 0, 'rows': 0}
+
+        def pending_jobs():
+            for window_start, window_end in self.windows(start_date, end_date):
+                for source, ids in (('device', device_sns), ('plant', plant_ids)):
+                    for target_id in ids:
+                        key = f"{source}:{target_id}:{window_start.isoformat()}:{window_end.isoformat()}"
+                        if key in completed:
+                            summary['skipped'] += 1
+                        else:
+                            yield key, source, target_id, window_start, window_end
+
+        writer = self.writers[self.output_format](self.output)
+        try:
+            with open(self.checkpoint, 'a', encoding='utf-8') as checkpoint, \
+                    ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                fetch = in_context(self._fetch)
+                # Only keep a few windows in flight, so memory does not grow with the export size
+                jobs = pending_jobs()
+                futures = {}
+                while True:
+                    for job in itertools.islice(jobs, self.max_workers * 2 - len(futures)):
+                        futures[executor.submit(fetch, *job[1:])] = job[0]
+                    if not futures:
+                        break
+
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key = futures.pop(future)
+                        try:
+                            rows = future.result()
+                        except Exception as error:
+                            logger.warning("Exporting %s failed: %s", key, error)
+                            summary['failed'] += 1
+                            continue
+
+                        # Only record the window as done once its rows are written
+                        writer.write(key, rows)
+                        checkpoint.write(key + '\n')
+                        checkpoint.flush()
+                        summary['exported'] += 1
+                        summary['rows'] += len(rows)
+                        logger.info("Exported %s (%d rows)", key, len(rows))
+        finally:
+            writer.close()
+
+        return summary
@@ -0,0 +1,233 @@
+"""
+Bounded in-memory history of polled device values with rolling statistics.
+"""
+import datetime
+import math
+import threading
+import time
+from array import array
+from collections import deque
+
+from .units import parse_value
+
+# Device type -> fields kept by DeviceHistory, as returned by the pollers
+DEFAULT_FIELDS = {
+    'min': ('ppv', 'pac', 'bdc1Soc'),
+    'sph': ('ppv1', 'ppv2', 'pac', 'soc'),
+    'tlx': ('ppv', 'pac', 'SOC'),
+    'mix': ('ppv', 'pLocalLoad', 'SOC'),
+    'noah': ('ppv', 'pac', 'soc'),
+}
+
+
+class RingBuffer:
+    """
+    Fixed size, array-backed buffer of (timestamp, value) samples with rolling statistics.
+
+    The buffer keeps at most `capacity` samples, and when `window` is set only the samples
+    of the last `window` seconds (relative to the newest sample). The mean, minimum and
+    maximum are maintained on every append in amortized constant time, using a running sum
+    and monotonic queues of the samples that can still become the minimum or maximum.
+
+    Args:
+        capacity (int): Maximum number of samples.
+        window (float, optional): Only keep samples of the last this many seconds.
+    """
+
+    def __init__(self, capacity, window=None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.window = window
+        self._times = array('d', bytes(8 * capacity))
+        self._values = array('d', bytes(8 * capacity))
+        # Sequence numbers of the oldest sample and of the next sample
+        self._start = 0
+        self._end = 0
+        self._sum = 0.0
+        # Sequence numbers of the candidates for the minimum and maximum, oldest first
+        self._min = deque()
+        self._max = deque()
+
+    def __len__(self):
+        return self._end - self._start
+
+    def _value(self, sequence):
+        return self._values[sequence % self.capacity]
+
+    def _evict(self):
+        self._sum -= self._value(self._start)
+        if self._min[0] == self._start:
+            self._min.popleft()
+        if self._max[0] == self._start:
+            self._max.popleft()
+        self._start += 1
+        if self._start == self._end:
+            # Reset the running sum so rounding errors do not accumulate
+            self._sum = 0.0
+
+    def append(self, timestamp, value):
+        """
+        Add a sample.
+
+        Args:
+            timestamp (float): Time of the sample in seconds (e.g. time.time()).
+            value (float): The value.
+        """
+        if len(self) == self.capacity:
+            self._evict()
+
+        index = self._end % self.capacity
+        self._times[index] = timestamp
+        self._values[index] = value
+        self._sum += value
+        while self._min and self._value(self._min[-1]) >= value:
+            self._min.pop()
+        self._min.append(self._end)
+        while self._max and self._value(self._max[-1]) <= value:
+            self._max.pop()
+        self._max.append(self._end)
+        self._end += 1
+
+        if self.window is not None:
+            oldest = timestamp - self.window
+            while self._times[self._start % self.capacity] < oldest:
+                self._evict()
+
+    def samples(self):
+        """
+        The samples as a list of (timestamp, value) tuples, oldest first.
+        """
+        return [(self._times[sequence % self.capacity], self._value(sequence))
+                for sequence in range(self._start, self._end)]
+
+    def stats(self):
+        """
+        Statistics of the samples in the buffer.
+
+        Returns:
+            dict: None when the buffer is empty, otherwise a dictionary containing:
+                - count (int): Number of samples
+                - last (float): The newest value
+                - mean (float): Mean of the values
+                - min (float): Minimum value
+                - max (float): Maximum value
+                - ramp_rate (float): Change per second between the oldest and newest sample,
+                  None for a single sample
+                - start (float), end (float): Timestamps of the oldest and newest sample
+        """
+        count = len(self)
+        if not count:
+            return None
+        first = self._start % self.capacity
+        last = (self._end - 1) % self.capacity
+        duration = self._times[last] - self._times[first]
+        return {
+            'count': count,
+            'last': self._values[last],
+            'mean': self._sum / count,
+            'min': self._value(self._min[0]),
+            'max': self._value(self._max[0]),
+            'ramp_rate': (self._values[last] - self._values[first]) / duration if duration > 0 else None,
+            'start': self._times[first],
+            'end': self._times[last],
+        }
+
+
+class DeviceHistory:
+    """
+    Keep the recent values of selected fields of every device in RingBuffers.
+
+    Memory is fixed per device and field: `capacity` samples of two 8 byte floats.
+    Feed it the records of a Poller or AdaptivePoller (min_energy, sph_energy,
+    noah_system_status, ...) with update_record, or any data with update.
+
+    Args:
+        fields (dict, optional): Device type -> fields to keep. Defaults to DEFAULT_FIELDS.
+        capacity (int): Samples kept per device and field. Defaults to 288 (one day of 5 minute polls).
+        window (float, optional): Only keep samples of the last this many seconds, e.g. 3 * 3600.
+
+    Example:
+        history = DeviceHistory(window=3 * 3600)
+        poller.run(history.update_record)
+        ...
+        soc = history.stats("DEVICE_SERIAL_NUMBER", "bdc1Soc")
+        if soc and soc['min'] < 20:
+            print(f"SOC dropped to {soc['min']}%, ramp {soc['ramp_rate'] * 3600:.1f}%/h")
+    """
+
+    def __init__(self, fields=None, capacity=288, window=None):
+        self.fields = dict(fields or DEFAULT_FIELDS)
+        self.capacity = capacity
+        self.window = window
+        # device_sn -> field -> RingBuffer
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def update(self, device_sn, device_type, data, timestamp=None):
+        """
+        Add the numeric values of the kept fields of a device sample.
+
+        Args:
+            device_sn (str): The serial number of the device.
+            device_type (str): The device type, selects the fields to keep.
+            data (dict): The device data.
+            timestamp (float, optional): Time of the sample in seconds. Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        data = data or {}
+        with self._lock:
+            buffers = self._buffers.setdefault(device_sn, {})
+            for field in self.fields.get(device_type, ()):
+                parsed = parse_value(data.get(field))
+                if parsed is None or math.isnan(parsed[0]):
+                    continue
+                buffer = buffers.get(field)
+                if buffer is None:
+                    buffer = buffers[field] = RingBuffer(self.capacity, self.window)
+                buffer.append(timestamp, parsed[0])
+
+    def update_record(self, record):
+        """
+        Add a Poller record, records of failed polls are ignored.
+        """
+        if record.get('data') is None:
+            return
+        timestamp = None
+        if record.get('time'):
+            timestamp = datetime.datetime.fromisoformat(record['time']).timestamp()
+        self.update(record['device_sn'], record['device_type'], record['data'], timestamp)
+
+    def stats(self, device_sn, field=None):
+        """
+        Rolling statistics of a device, see RingBuffer.stats().
+
+        Args:
+            device_sn (str): The serial number of the device.
+            field (str, optional): Only return the statistics of this field.
+
+        Returns:
+            dict: The statistics of the field (None if it has no samples), or field -> statistics.
+        """
+        with self._lock:
+            buffers = self._buffers.get(device_sn, {})
+            if field is not None:
+                buffer = buffers.get(field)
+                return buffer.stats() if buffer is not None else None
+            return {name: buffer.stats() for name, buffer in buffers.items()}
+
+    def samples(self, device_sn, field):
+        """
+        The kept (timestamp, value) samples of a device field, oldest first.
+        """
+        with self._lock:
+            buffer = self._buffers.get(device_sn, {}).get(field)
+            return buffer.samples() if buffer is not None else []
+
+    def remove(self, device_sn):
+        """
+        Forget the history of a device.
+        """
+        with self._lock:
+            self._buffers.pop(device_sn, None)
@@ -1,9 +1,18 @@
+import logging
+import threading
+import time
 import warnings
-from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from enum import Enum
 from . import GrowattApi
 import platform
-from .exceptions import GrowattParameterError, GrowattV1ApiError
+import requests
+from .exceptions import GrowattError, GrowattParameterError, GrowattV1ApiError
+from .schedules import parse_time_segments, validate_segments
+from .timeouts import in_context
+
+logger = logging.getLogger(__name__)
 
 
 class DeviceType(Enum):
@@ -28,6 +37,34 @@ class OpenApiV1(GrowattApi):
     the public V1 API described here: https://www.showdoc.com.cn/262556420217021/0
     """
 
+    # Maximum number of registers read by a single set_any_reg request
+    max_register_span = 100
+
+    # Maximum number of serial numbers in a single batch data request
+    max_batch_size = 100
+
+    # Maximum age in seconds of cached sph_detail settings used to reconcile SPH writes
+    sph_settings_max_age = 3600
+
+    # Minimum seconds between refreshes of the device type index triggered by unknown serial numbers
+    device_types_refresh_interval = 600
+
+    # Type specific implementations of the generic device_* methods
+    _device_methods = {
+        DeviceType.MIN: {
+            'detail': 'min_detail',
+            'energy': 'min_energy',
+            'energy_batch': 'min_energy_batch',
+            'history': 'min_energy_history',
+        },
+        DeviceType.SPH: {
+            'detail': 'sph_detail',
+            'energy': 'sph_energy',
+            'energy_batch': 'sph_energy_batch',
+            'history': 'sph_energy_history',
+        },
+    }
+
     def _create_user_agent(self):
         python_version = platform.python_version()
         system = platform.system()
@@ -53,6 +90,19 @@ class OpenApiV1(GrowattApi):
         # Set up authentication for V1 API using the provided token
         self.session.headers.update({"token": token})
 
+        # Serial number -> DeviceType index, filled from device_list responses
+        self._device_types = {}
+        # time.monotonic() of the last refresh_device_types(), None before the first one
+        self._device_types_refreshed = None
+        self._device_types_lock = threading.Lock()
+
+        # Serial number -> (time.monotonic(), settings) of the last sph_detail response
+        self._sph_settings = {}
+
+    def _set_server_url(self, server_url):
+        super()._set_server_url(server_url)
+        self.api_url = f"{self.server_url}v1/"
+
     def _process_response(self, response, operation_name="API operation"):
         """
         Process API response and handle errors.
@@ -299,7 +349,167 @@ class OpenApiV1(GrowattApi):
                 "perpage": "",
             },
         )
-        return self._process_response(response.json(), "getting device list")
+        data = self._process_response(response.json(), "getting device list")
+        self._index_device_types(data)
+        return data
+
+    def _index_device_types(self, device_data):
+        """
+        Remember the device type of every device in a device_list response.
+
+        Args:
+            device_data (dict): The 'data' portion of a device_list response.
+        """
+        for device in (device_data or {}).get('devices', []):
+            try:
+                self._device_types[device['device_sn']] = DeviceType(int(device['type']))
+            except (KeyError, ValueError, TypeError):
+                continue
+
+    def refresh_device_types(self):
+        """
+        Rebuild the serial number -> DeviceType index from all plants on the account.
+
+        Returns:
+            dict: A dictionary mapping device serial numbers to DeviceType.
+
+        Raises:
+            GrowattV1ApiError: If the API returns an error response.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+        plants = self.plant_list()
+        for plant in (plants or {}).get('plants', []):
+            self.device_list(plant['plant_id'])
+        self._device_types_refreshed = time.monotonic()
+        return dict(self._device_types)
+
+    def device_type(self, device_sn):
+        """
+        Get the type of a device by its serial number.
+
+        The type is looked up in an in-memory index which is filled by every
+        device_list call. Only when the serial number is not known yet the index
+        is refreshed from all plants on the account, at most once per
+        device_types_refresh_interval seconds, so repeated lookups of a serial number
+        that is not on the account (or of an unsupported type) do not walk the account
+        every time.
+
+        Args:
+            device_sn (str): The serial number of the device.
+
+        Returns:
+            DeviceType: The type of the device.
+
+        Raises:
+            GrowattParameterError: If the device can not be found on the account.
+            GrowattV1ApiError: If the API returns an error response.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+        if device_sn not in self._device_types:
+            with self._device_types_lock:
+                # Another thread may have refreshed while this one waited for the lock
+                refreshed = self._device_types_refreshed
+                if device_sn not in self._device_types and (
+                        refreshed is None or time.monotonic() - refreshed >= self.device_types_refresh_interval):
+                    self.refresh_device_types()
+
+        try:
+            return self._device_types[device_sn]
+        except KeyError:
+            raise GrowattParameterError(f"device {device_sn} not found on this account")
+
+    def _device_method(self, device_sn, operation):
+        """
+        Resolve the type specific method implementing a generic device operation.
+        """
+        methods = self._device_methods.get(self.device_type(device_sn))
+        if methods is None:
+            raise GrowattParameterError(
+                f"device {device_sn} of type {self._device_types[device_sn].name} is not supported")
+        return getattr(self, methods[operation])
+
+    def device_detail(self, device_sn):
+        """
+        Get detailed data for a device, using min_detail or sph_detail depending on its type.
+
+        Args:
+            device_sn (str): The serial number of the device.
+
+        Returns:
+            dict: A dictionary containing the device details.
+
+        Raises:
+            GrowattParameterError: If the device is unknown or its type is not supported.
+            GrowattV1ApiError: If the API returns an error response.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+        return self._device_method(device_sn, 'detail')(device_sn)
+
+    def device_energy(self, device_sn):
+        """
+        Get energy data for a device, using min_energy or sph_energy depending on its type.
+
+        Args:
+            device_sn (str): The serial number of the device.
+
+        Returns:
+            dict: A dictionary containing the device energy data.
+
+        Raises:
+            GrowattParameterError: If the device is unknown or its type is not supported.
+            GrowattV1ApiError: If the API returns an error response.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+        return self._device_method(device_sn, 'energy')(device_sn)
+
+    def device_energy_batch(self, device_sns, max_workers=4):
+        """
+        Get energy data for many devices, using min_energy_batch and sph_energy_batch depending on their type.
+
+        Args:
+            device_sns (iterable): The serial numbers of the devices.
+            max_workers (int): Number of batch requests running concurrently. Defaults to 4.
+
+        Returns:
+            dict: The energy data of every device keyed by serial number, None for devices the server returned no data for.
+
+        Raises:
+            GrowattParameterError: If a device is unknown or its type is not supported.
+            GrowattV1ApiError: If the API returns an error response.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+        by_method = {}
+        for device_sn in device_sns:
+            by_method.setdefault(self._device_method(device_sn, 'energy_batch'), []).append(device_sn)
+
+        energy = {}
+        for method, method_sns in by_method.items():
+            energy.update(method(method_sns, max_workers=max_workers))
+        return energy
+
+    def device_history(self, device_sn, start_date=None, end_date=None, timezone=None, page=None, limit=None):
+        """
+        Get data history for a device, using min_energy_history or sph_energy_history depending on its type.
+
+        Args:
+            device_sn (str): The serial number of the device.
+            start_date (date, optional): Start date. Defaults to today.
+            end_date (date, optional): End date. Defaults to today.
+            timezone (str, optional): Timezone ID.
+            page (int, optional): Page number.
+            limit (int, optional): Results per page.
+
+        Returns:
+            dict: A dictionary containing the device history data.
+
+        Raises:
+            GrowattParameterError: If the device is unknown, its type is not supported
+                or the date interval is invalid (exceeds 7 days).
+            GrowattV1ApiError: If the API returns an error response.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+        return self._device_method(device_sn, 'history')(
+            device_sn, start_date=start_date, end_date=end_date, timezone=timezone, page=page, limit=limit)
 
     def min_detail(self, device_sn):
         """
@@ -349,6 +559,62 @@ class OpenApiV1(GrowattApi):
 
         return self._process_response(response.json(), "getting MIN inverter energy data")
 
+    def _energy_batch(self, page, sn_param, list_field, sn_field, device_sns, max_workers, operation_name):
+        """
+        Fetch the latest data of many devices from a batch data endpoint, max_batch_size serials per request.
+        """
+        device_sns = list(dict.fromkeys(device_sns))
+        batches = [device_sns[i:i + self.max_batch_size] for i in range(0, len(device_sns), self.max_batch_size)]
+
+        def fetch(batch):
+            response = self.session.post(
+                url=self._get_url(page),
+                data={
+                    sn_param: ",".join(batch),
+                },
+            )
+            data = self._process_response(response.json(), operation_name) or {}
+            entries = data.get(list_field, []) if isinstance(data, dict) else data
+            result = {}
+            for entry in entries or []:
+                if isinstance(entry, dict) and entry.get(sn_field) is not None:
+                    result[entry[sn_field]] = entry.get('data', entry)
+            return result
+
+        if max_workers > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(in_context(fetch), batches))
+        else:
+            results = [fetch(batch) for batch in batches]
+
+        energy = {}
+        for result in results:
+            energy.update(result)
+        return {device_sn: energy.get(device_sn) for device_sn in device_sns}
+
+    def min_energy_batch(self, device_sns, max_workers=4):
+        """
+        Get energy data for many MIN inverters with as few requests as possible.
+
+        The serial numbers are split into batches of at most max_batch_size (100), each
+        fetched with a single request, and the batches are fetched concurrently.
+
+        Args:
+            device_sns (iterable): The serial numbers of the MIN inverters.
+            max_workers (int): Number of batch requests running concurrently. Defaults to 4.
+
+        Returns:
+            dict: The energy data of every inverter (as returned by min_energy) keyed by
+                serial number, None for inverters the server returned no data for.
+
+        Raises:
+            GrowattV1ApiError: If the API returns an error response.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+
+        return self._energy_batch("device/tlx/tlxs_data", "tlxs", "tlxs", "tlx_sn", device_sns, max_workers,
+                                  "getting MIN inverters energy data")
+
     def min_energy_history(self, device_sn, start_date=None, end_date=None, timezone=None, page=None, limit=None):
         """
         Get MIN inverter data history.
@@ -470,6 +736,89 @@ class OpenApiV1(GrowattApi):
 
         return self._process_response(response.json(), f"reading parameter {parameter_id}")
 
+    @staticmethod
+    def _plan_register_ranges(addresses, max_span):
+        """
+        Merge register addresses into the fewest contiguous ranges of at most max_span registers.
+
+        Returns:
+            list: (start_address, end_address) tuples, both inclusive.
+        """
+        ranges = []
+        for address in sorted(set(int(address) for address in addresses)):
+            if ranges and address - ranges[-1][0] < max_span:
+                ranges[-1] = (ranges[-1][0], address)
+            else:
+                ranges.append((address, address))
+        return ranges
+
+    @staticmethod
+    def _register_values(data, start_address, end_address):
+        """
+        Map the data of a set_any_reg read to register addresses.
+
+        The values can be returned as a dict keyed by address, a list or a comma separated
+        string in address order, or a single value when one register was read.
+        """
+        if isinstance(data, dict):
+            try:
+                return {int(address): value for address, value in data.items()}
+            except (TypeError, ValueError):
+                values = list(data.values())
+        elif isinstance(data, (list, tuple)):
+            values = list(data)
+        elif isinstance(data, str) and start_address != end_address:
+            values = data.split(',')
+        else:
+            values = [data]
+
+        return {start_address + offset: value for offset, value in enumerate(values)
+                if start_address + offset <= end_address}
+
+    def min_read_registers(self, device_sn, addresses, max_span=None, max_workers=1):
+        """
+        Read many registers from a MIN inverter with as few requests as possible.
+
+        The addresses are merged into contiguous ranges of at most max_span registers and
+        each range is read with a single set_any_reg min_read_parameter call.
+
+        Args:
+            device_sn (str): The ID of the TLX inverter.
+            addresses (iterable): Register addresses to read.
+            max_span (int, optional): Maximum number of registers per request. Defaults to max_register_span.
+            max_workers (int): Number of ranges read concurrently. Defaults to 1 since the endpoint is heavily rate limited.
+
+        Returns:
+            dict: A dictionary mapping each requested address to its value (None if the server did not return it).
+
+        Raises:
+            GrowattParameterError: If max_span is invalid.
+            GrowattV1ApiError: If the API returns an error response.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+        max_span = max_span or self.max_register_span
+        if max_span < 1:
+            raise GrowattParameterError("max_span must be at least 1")
+
+        addresses = set(int(address) for address in addresses)
+        ranges = self._plan_register_ranges(addresses, max_span)
+
+        def read(register_range):
+            start_address, end_address = register_range
+            data = self.min_read_parameter(device_sn, None, start_address=start_address, end_address=end_address)
+            return self._register_values(data, start_address, end_address)
+
+        if max_workers > 1 and len(ranges) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(in_context(read), ranges))
+        else:
+            results = [read(register_range) for register_range in ranges]
+
+        values = {}
+        for result in results:
+            values.update(result)
+        return {address: values.get(address) for address in sorted(addresses)}
+
     def min_write_parameter(self, device_sn, parameter_id, parameter_values=None):
         """
         Set parameters on a MIN inverter.
@@ -528,7 +877,8 @@ class OpenApiV1(GrowattApi):
 
         return self._process_response(response.json(), f"writing parameter {parameter_id}")
 
-    def min_write_time_segment(self, device_sn, segment_id, batt_mode, start_time, end_time, enabled=True):
+    def min_write_time_segment(self, device_sn, segment_id, batt_mode, start_time, end_time, enabled=True,
+                               settings_data=None):
         """
         Set a time segment for a MIN inverter.
 
@@ -539,6 +889,8 @@ class OpenApiV1(GrowattApi):
             start_time (datetime.time): Start time for the segment.
             end_time (datetime.time): End time for the segment.
             enabled (bool): Whether this segment is enabled.
+            settings_data (dict, optional): Settings data from min_settings. When given, the segment
+                is checked not to overlap the other enabled segments before it is written.
 
         Returns:
             dict: The server response.
@@ -555,6 +907,12 @@ class OpenApiV1(GrowattApi):
         if not 0 <= batt_mode <= 2:
             raise GrowattParameterError("batt_mode must be between 0 and 2")
 
+        if settings_data is not None and enabled:
+            validate_segments([segment for segment in parse_time_segments(settings_data, 'min')
+                               if segment['segment_id'] != segment_id] +
+                              [{'segment_id': segment_id, 'start_time': start_time, 'end_time': end_time}],
+                              changed=(segment_id,))
+
         # Initialize ALL 19 parameters as empty strings, not just the ones we need
         all_params = {
             "tlx_sn": device_sn,
@@ -604,6 +962,8 @@ class OpenApiV1(GrowattApi):
                 - mode_name (str): String representation of the mode
                 - start_time (str): Start time in format "HH:MM"
                 - end_time (str): End time in format "HH:MM"
+                - start_minute (int): Start time in minutes since midnight
+                - end_minute (int): End time in minutes since midnight
                 - enabled (bool): Whether the segment is enabled
 
         Example:
@@ -624,76 +984,156 @@ class OpenApiV1(GrowattApi):
             # Fetch settings if not provided
             settings_data = self.min_settings(device_sn=device_sn)
 
-        # Define mode names
-        mode_names = {
-            0: "Load First",
-            1: "Battery First",
-            2: "Grid First"
-        }
+        return parse_time_segments(settings_data, 'min')
 
-        segments = []
+    @staticmethod
+    def _time_string(value):
+        """
+        Format a datetime.time or "H:M" string as "HH:MM".
+        """
+        if isinstance(value, str):
+            hour, minute = value.split(":")
+            return f"{int(hour):02d}:{int(minute):02d}"
+        return f"{value.hour:02d}:{value.minute:02d}"
+
+    @staticmethod
+    def _complete_segment(current, desired):
+        """
+        A desired time segment with the mode and times it does not specify taken from the segment as read
+        from the settings.
+        """
+        return {**{field: current[field] for field in ('batt_mode', 'start_time', 'end_time')
+                   if current.get(field) is not None},
+                **desired}
 
-        # Process each time segment
-        for i in range(1, 10):  # Segments 1-9
-            # Get raw time values
-            start_time_raw = settings_data.get(f'forcedTimeStart{i}', "0:0")
-            end_time_raw = settings_data.get(f'forcedTimeStop{i}', "0:0")
+    @classmethod
+    def _segment_differs(cls, current, desired):
+        """
+        Whether a time segment or period as read from the settings differs from a desired one.
+        Disabled segments are equal regardless of their mode and times, a mode or time the
+        desired segment does not specify is the current one.
+        """
+        if bool(desired.get('enabled', True)) != current['enabled']:
+            return True
+        if not current['enabled']:
+            return False
+        desired = cls._complete_segment(current, desired)
+        return (desired.get('batt_mode') != current.get('batt_mode') or
+                cls._time_string(desired['start_time']) != current['start_time'] or
+                cls._time_string(desired['end_time']) != current['end_time'])
+
+    def min_write_time_segments(self, device_sn, segments, settings_data=None, verify=True):
+        """
+        Apply a Time-of-Use schedule to a MIN inverter, writing only the segments that changed.
 
-            # Handle 'null' string values
-            if start_time_raw == 'null' or not start_time_raw:
-                start_time_raw = "0:0"
-            if end_time_raw == 'null' or not end_time_raw:
-                end_time_raw = "0:0"
+        The current schedule is read once (with min_settings, unless settings_data is passed),
+        only segments that differ from it are written with min_write_time_segment, and the
+        written segments are verified with one more min_settings call. Segments not in the
+        plan are left untouched.
 
-            # Format times with leading zeros (HH:MM)
-            try:
-                start_parts = start_time_raw.split(":")
-                start_hour = int(start_parts[0])
-                start_min = int(start_parts[1])
-                start_time = f"{start_hour:02d}:{start_min:02d}"
-            except (ValueError, IndexError):
-                start_time = "00:00"
+        Args:
+            device_sn (str): The serial number of the inverter.
+            segments (list): Desired segments, dicts with keys:
+                - segment_id (int): Time segment ID (1-9)
+                - batt_mode (int, optional): 0=load priority, 1=battery priority, 2=grid priority
+                - start_time (datetime.time or str "HH:MM", optional): Start time for the segment
+                - end_time (datetime.time or str "HH:MM", optional): End time for the segment
+                - enabled (bool, optional): Whether this segment is enabled. Defaults to True.
+                batt_mode, start_time and end_time default to the current values of the segment,
+                e.g. {"segment_id": 3, "enabled": False} only disables segment 3.
+            settings_data (dict, optional): Settings data from min_settings to avoid reading them again.
+            verify (bool): Read the settings back after writing to verify the written segments. Defaults to True.
 
-            try:
-                end_parts = end_time_raw.split(":")
-                end_hour = int(end_parts[0])
-                end_min = int(end_parts[1])
-                end_time = f"{end_hour:02d}:{end_min:02d}"
-            except (ValueError, IndexError):
-                end_time = "00:00"
-
-            # Get the mode value safely
-            mode_raw = settings_data.get(f'time{i}Mode')
-            if mode_raw == 'null' or mode_raw is None:
-                batt_mode = None
-            else:
-                try:
-                    batt_mode = int(mode_raw)
-                except (ValueError, TypeError):
-                    batt_mode = None
-
-            # Get the enabled status safely
-            enabled_raw = settings_data.get(f'forcedStopSwitch{i}', 0)
-            if enabled_raw == 'null' or enabled_raw is None:
-                enabled = False
-            else:
-                try:
-                    enabled = int(enabled_raw) == 1
-                except (ValueError, TypeError):
-                    enabled = False
-
-            segment = {
-                'segment_id': i,
-                'batt_mode': batt_mode,
-                'mode_name': mode_names.get(batt_mode, "Unknown"),
-                'start_time': start_time,
-                'end_time': end_time,
-                'enabled': enabled
-            }
+        Returns:
+            list: A list of dictionaries, one per desired segment, containing:
+                - segment_id (int): The segment number (1-9)
+                - status (str): 'unchanged', 'written' (not verified), 'verified',
+                  'mismatch' (written but read back differently), 'failed' or 'skipped'
+                  (not attempted after a connection error, timeout or deadline)
+                - error (str): The error message, only for 'failed' segments
 
-            segments.append(segment)
+        Example:
+            from datetime import time
 
-        return segments
+            results = api.min_write_time_segments("DEVICE_SERIAL_NUMBER", [
+                {"segment_id": 1, "batt_mode": 1, "start_time": time(1, 0), "end_time": time(5, 0)},
+                {"segment_id": 2, "batt_mode": 2, "start_time": time(17, 0), "end_time": time(21, 0)},
+                {"segment_id": 3, "batt_mode": 0, "start_time": time(0, 0), "end_time": time(0, 0), "enabled": False},
+            ])
+
+        Raises:
+            GrowattParameterError: If a segment is invalid or a segment being written would overlap another enabled segment.
+            GrowattV1ApiError: If reading the current settings fails.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+        segment_ids = [segment['segment_id'] for segment in segments]
+        if len(set(segment_ids)) != len(segment_ids):
+            raise GrowattParameterError("every segment_id may only be given once")
+        for segment in segments:
+            if not 1 <= segment['segment_id'] <= 9:
+                raise GrowattParameterError("segment_id must be between 1 and 9")
+            if 'batt_mode' in segment and not 0 <= segment['batt_mode'] <= 2:
+                raise GrowattParameterError("batt_mode must be between 0 and 2")
+
+        current = {segment['segment_id']: segment
+                   for segment in self.min_read_time_segments(device_sn, settings_data)}
+        segments = [self._complete_segment(current[segment['segment_id']], segment) for segment in segments]
+        for segment in segments:
+            if not {'batt_mode', 'start_time', 'end_time'} <= segment.keys():
+                raise GrowattParameterError(
+                    f"segment {segment['segment_id']} needs batt_mode, start_time and end_time, "
+                    "its current values could not be read")
+
+        # The segments being written may not overlap the schedule as it will be once they are written
+        planned = {segment['segment_id']: segment for segment in segments}
+        changed = {segment_id for segment_id, segment in planned.items()
+                   if self._segment_differs(current[segment_id], segment)}
+        validate_segments([planned.get(segment_id, segment) for segment_id, segment in current.items()],
+                          changed=changed)
+
+        results = []
+        written = []
+        for segment in segments:
+            segment_id = segment['segment_id']
+            if segment_id not in changed:
+                results.append({'segment_id': segment_id, 'status': 'unchanged'})
+                continue
+
+            start_time, end_time = segment['start_time'], segment['end_time']
+            if isinstance(start_time, str):
+                start_time = datetime.strptime(start_time, "%H:%M").time()
+            if isinstance(end_time, str):
+                end_time = datetime.strptime(end_time, "%H:%M").time()
+
+            try:
+                self.min_write_time_segment(device_sn, segment_id, segment['batt_mode'],
+                                            start_time, end_time, segment.get('enabled', True))
+            except GrowattV1ApiError as error:
+                results.append({'segment_id': segment_id, 'status': 'failed', 'error': error.error_msg or str(error)})
+                continue
+            except (GrowattError, requests.exceptions.RequestException) as error:
+                # The server can not be reached (or the deadline passed), the other writes would fail too
+                results.append({'segment_id': segment_id, 'status': 'failed', 'error': str(error)})
+                done = {result['segment_id'] for result in results}
+                results.extend({'segment_id': other['segment_id'], 'status': 'skipped'}
+                               for other in segments if other['segment_id'] not in done)
+                break
+
+            result = {'segment_id': segment_id, 'status': 'written'}
+            results.append(result)
+            written.append((result, segment))
+
+        if verify and written:
+            try:
+                readback = {segment['segment_id']: segment for segment in self.min_read_time_segments(device_sn)}
+            except (GrowattError, requests.exceptions.RequestException) as error:
+                # The segments were written, they just could not be verified
+                logger.warning("Verifying the time segments of %s failed: %s", device_sn, error)
+                return results
+            for result, segment in written:
+                result['status'] = 'mismatch' if self._segment_differs(readback[segment['segment_id']], segment) else 'verified'
+
+        return results
 
     # SPH Device Methods (Device Type 5)
 
@@ -720,7 +1160,35 @@ class OpenApiV1(GrowattApi):
             }
         )
 
-        return self._process_response(response.json(), "getting SPH inverter details")
+        data = self._process_response(response.json(), "getting SPH inverter details")
+        # A copy, so applying written settings to the cache does not change the caller's data
+        self._sph_settings[device_sn] = (time.monotonic(), dict(data) if isinstance(data, dict) else data)
+        return data
+
+    def _cached_sph_detail(self, device_sn):
+        """
+        The settings of the last sph_detail call for a device, or fresh ones when they are
+        missing or older than sph_settings_max_age.
+        """
+        cached = self._sph_settings.get(device_sn)
+        if cached is not None and time.monotonic() - cached[0] < self.sph_settings_max_age:
+            return cached[1]
+        return self.sph_detail(device_sn)
+
+    def _update_cached_sph_detail(self, device_sn, values):
+        """
+        Apply written settings to the cached sph_detail data of a device (a copy owned by the cache).
+        """
+        cached = self._sph_settings.get(device_sn)
+        if cached is not None and cached[1] is not None:
+            cached[1].update(values)
+
+    def _sph_periods_differ(self, current, periods):
+        """
+        Whether any of the desired periods differs from the periods read from the settings.
+        """
+        return any(self._segment_differs(current_period, period)
+                   for current_period, period in zip(current, periods))
 
     def sph_energy(self, device_sn):
         """
@@ -747,6 +1215,29 @@ class OpenApiV1(GrowattApi):
 
         return self._process_response(response.json(), "getting SPH inverter energy data")
 
+    def sph_energy_batch(self, device_sns, max_workers=4):
+        """
+        Get energy data for many SPH inverters with as few requests as possible.
+
+        The serial numbers are split into batches of at most max_batch_size (100), each
+        fetched with a single request, and the batches are fetched concurrently.
+
+        Args:
+            device_sns (iterable): The serial numbers of the SPH inverters.
+            max_workers (int): Number of batch requests running concurrently. Defaults to 4.
+
+        Returns:
+            dict: The energy data of every inverter (as returned by sph_energy) keyed by
+                serial number, None for inverters the server returned no data for.
+
+        Raises:
+            GrowattV1ApiError: If the API returns an error response.
+            requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        """
+
+        return self._energy_batch("device/mix/mixs_data", "mixs", "mixs", "mix_sn", device_sns, max_workers,
+                                  "getting SPH inverters energy data")
+
     def sph_energy_history(self, device_sn, start_date=None, end_date=None, timezone=None, page=None, limit=None):
         """
         Get SPH inverter data history.
@@ -900,7 +1391,8 @@ class OpenApiV1(GrowattApi):
 
         return self._process_response(response.json(), f"writing parameter {parameter_id}")
 
-    def sph_write_ac_charge_times(self, device_sn, charge_power, charge_stop_soc, mains_enabled, periods):
+    def sph_write_ac_charge_times(self, device_sn, charge_power, charge_stop_soc, mains_enabled, periods,
+                                  reconcile=False, settings_data=None):
         """
         Set AC charge time periods for an SPH inverter.
 
@@ -913,9 +1405,13 @@ class OpenApiV1(GrowattApi):
                 - start_time (datetime.time): Start time for the period
                 - end_time (datetime.time): End time for the period
                 - enabled (bool): Whether this period is enabled
+            reconcile (bool): Only write when the current settings differ from the desired ones.
+                The current settings are taken from settings_data or a cached sph_detail
+                response (at most sph_settings_max_age seconds old). Defaults to False.
+            settings_data (dict, optional): Settings data from sph_detail to reconcile against.
 
         Returns:
-            dict: The server response.
+            dict: The server response, None when reconcile skipped the write.
 
         Example:
             from datetime import time
@@ -933,7 +1429,7 @@ class OpenApiV1(GrowattApi):
             )
 
         Raises:
-            GrowattParameterError: If parameters are invalid.
+            GrowattParameterError: If parameters are invalid or enabled periods overlap.
             GrowattV1ApiError: If the API returns an error response.
             requests.exceptions.RequestException: If there is an issue with the HTTP request.
         """
@@ -946,6 +1442,15 @@ class OpenApiV1(GrowattApi):
         if len(periods) != 3:
             raise GrowattParameterError("periods must contain exactly 3 period definitions")
 
+        validate_segments(periods, 'period_id')
+
+        if reconcile:
+            current = self.sph_read_ac_charge_times(settings_data=settings_data or self._cached_sph_detail(device_sn))
+            if (current['charge_power'] == charge_power and current['charge_stop_soc'] == charge_stop_soc and
+                    current['mains_enabled'] == bool(mains_enabled) and
+                    not self._sph_periods_differ(current['periods'], periods)):
+                return None
+
         # Build request data
         request_data = {
             "mix_sn": device_sn,
@@ -970,9 +1475,17 @@ class OpenApiV1(GrowattApi):
             data=request_data
         )
 
-        return self._process_response(response.json(), "writing AC charge time periods")
-
-    def sph_write_ac_discharge_times(self, device_sn, discharge_power, discharge_stop_soc, periods):
+        data = self._process_response(response.json(), "writing AC charge time periods")
+        self._update_cached_sph_detail(device_sn, self._sph_period_settings(
+            "Charge", periods,
+            chargePowerCommand=charge_power,
+            wchargeSOCLowLimit=charge_stop_soc,
+            acChargeEnable=1 if mains_enabled else 0,
+        ))
+        return data
+
+    def sph_write_ac_discharge_times(self, device_sn, discharge_power, discharge_stop_soc, periods,
+                                     reconcile=False, settings_data=None):
         """
         Set AC discharge time periods for an SPH inverter.
 
@@ -984,9 +1497,13 @@ class OpenApiV1(GrowattApi):
                 - start_time (datetime.time): Start time for the period
                 - end_time (datetime.time): End time for the period
                 - enabled (bool): Whether this period is enabled
+            reconcile (bool): Only write when the current settings differ from the desired ones.
+                The current settings are taken from settings_data or a cached sph_detail
+                response (at most sph_settings_max_age seconds old). Defaults to False.
+            settings_data (dict, optional): Settings data from sph_detail to reconcile against.
 
         Returns:
-            dict: The server response.
+            dict: The server response, None when reconcile skipped the write.
 
         Example:
             from datetime import time
@@ -1003,7 +1520,7 @@ class OpenApiV1(GrowattApi):
             )
 
         Raises:
-            GrowattParameterError: If parameters are invalid.
+            GrowattParameterError: If parameters are invalid or enabled periods overlap.
             GrowattV1ApiError: If the API returns an error response.
             requests.exceptions.RequestException: If there is an issue with the HTTP request.
         """
@@ -1016,6 +1533,16 @@ class OpenApiV1(GrowattApi):
         if len(periods) != 3:
             raise GrowattParameterError("periods must contain exactly 3 period definitions")
 
+        validate_segments(periods, 'period_id')
+
+        if reconcile:
+            current = self.sph_read_ac_discharge_times(
+                settings_data=settings_data or self._cached_sph_detail(device_sn))
+            if (current['discharge_power'] == discharge_power and
+                    current['discharge_stop_soc'] == discharge_stop_soc and
+                    not self._sph_periods_differ(current['periods'], periods)):
+                return None
+
         # Build request data
         request_data = {
             "mix_sn": device_sn,
@@ -1039,7 +1566,24 @@ class OpenApiV1(GrowattApi):
             data=request_data
         )
 
-        return self._process_response(response.json(), "writing AC discharge time periods")
+        data = self._process_response(response.json(), "writing AC discharge time periods")
+        self._update_cached_sph_detail(device_sn, self._sph_period_settings(
+            "Discharge", periods,
+            disChargePowerCommand=discharge_power,
+            wdisChargeSOCLowLimit=discharge_stop_soc,
+        ))
+        return data
+
+    @staticmethod
+    def _sph_period_settings(time_type, periods, **settings):
+        """
+        The sph_detail fields of written charge or discharge periods.
+        """
+        for i, period in enumerate(periods, start=1):
+            settings[f'forced{time_type}TimeStart{i}'] = f"{period['start_time'].hour}:{period['start_time'].minute}"
+            settings[f'forced{time_type}TimeStop{i}'] = f"{period['end_time'].hour}:{period['end_time'].minute}"
+            settings[f'forced{time_type}StopSwitch{i}'] = 1 if period['enabled'] else 0
+        return settings
 
     def _parse_time_periods(self, settings_data, time_type):
         """
@@ -1056,59 +1600,11 @@ class OpenApiV1(GrowattApi):
                 - period_id (int): The period number (1-3)
                 - start_time (str): Start time in format "HH:MM"
                 - end_time (str): End time in format "HH:MM"
+                - start_minute (int): Start time in minutes since midnight
+                - end_minute (int): End time in minutes since midnight
                 - enabled (bool): Whether the period is enabled
         """
-        periods = []
-
-        # Process each time period (1-3 for SPH)
-        for i in range(1, 4):
-            # Get raw time values
-            start_time_raw = settings_data.get(f'forced{time_type}TimeStart{i}', "0:0")
-            end_time_raw = settings_data.get(f'forced{time_type}TimeStop{i}', "0:0")
-            enabled_raw = settings_data.get(f'forced{time_type}StopSwitch{i}', 0)
-
-            # Handle 'null' string values
-            if start_time_raw == 'null' or not start_time_raw:
-                start_time_raw = "0:0"
-            if end_time_raw == 'null' or not end_time_raw:
-                end_time_raw = "0:0"
-
-            # Format times with leading zeros (HH:MM)
-            try:
-                start_parts = start_time_raw.split(":")
-                start_hour = int(start_parts[0])
-                start_min = int(start_parts[1])
-                start_time = f"{start_hour:02d}:{start_min:02d}"
-            except (ValueError, IndexError):
-                start_time = "00:00"
-
-            try:
-                end_parts = end_time_raw.split(":")
-                end_hour = int(end_parts[0])
-                end_min = int(end_parts[1])
-                end_time = f"{end_hour:02d}:{end_min:02d}"
-            except (ValueError, IndexError):
-                end_time = "00:00"
-
-            # Get the enabled status
-            if enabled_raw == 'null' or enabled_raw is None:
-                enabled = False
-            else:
-                try:
-                    enabled = int(enabled_raw) == 1
-                except (ValueError, TypeError):
-                    enabled = False
-
-            period = {
-                'period_id': i,
-                'start_time': start_time,
-                'end_time': end_time,
-                'enabled': enabled
-            }
-
-            periods.append(period)
-
-        return periods
+        return parse_time_segments(settings_data, f"sph_{time_type.lower()}")
 
     def sph_read_ac_charge_times(self, device_sn=None, settings_data=None):
         """
@@ -1136,6 +1632,8 @@ class OpenApiV1(GrowattApi):
                     - period_id (int): The period number (1-3)
                     - start_time (str): Start time in format "HH:MM"
                     - end_time (str): End time in format "HH:MM"
+                    - start_minute (int): Start time in minutes since midnight
+                    - end_minute (int): End time in minutes since midnight
                     - enabled (bool): Whether the period is enabled
 
         Example:
@@ -1205,6 +1703,8 @@ class OpenApiV1(GrowattApi):
                     - period_id (int): The period number (1-3)
                     - start_time (str): Start time in format "HH:MM"
                     - end_time (str): End time in format "HH:MM"
+                    - start_minute (int): Start time in minutes since midnight
+                    - end_minute (int): End time in minutes since midnight
                     - enabled (bool): Whether the period is enabled
 
         Example:
@@ -0,0 +1,363 @@
+"""
+Polling of all devices on a Growatt account.
+"""
+import datetime
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .open_api_v1 import OpenApiV1, DeviceType
+from .rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class Poller:
+    """
+    Discover the devices on an account and poll their current data at a fixed cadence.
+
+    Works with both clients:
+        OpenApiV1 -- polls MIN (min_energy) and SPH (sph_energy) devices.
+        GrowattApi -- must be logged in, polls tlx (tlx_system_status), mix (mix_system_status)
+                      and noah (noah_system_status) devices.
+
+    Every device is polled once per interval. The first poll of each device is spread
+    randomly over the interval and every following poll is shifted by up to `jitter`
+    seconds, so requests do not all hit the server at the same moment.
+
+    Every poll produces a normalized record:
+        'time' -- ISO 8601 UTC time of the poll
+        'plant_id' -- The ID of the plant
+        'device_sn' -- The serial number of the device
+        'device_type' -- 'min', 'sph', 'tlx', 'mix' or 'noah'
+        'data' -- The data returned for the device
+        'error' -- Only present when the poll failed, the error message (data is None)
+
+    Args:
+        api (GrowattApi): Logged in GrowattApi or OpenApiV1 client.
+        interval (int or dict): Seconds between polls of a device, or a dict mapping
+            device types to intervals (missing types use 300). Defaults to 300.
+        jitter (float): Maximum random shift of every poll in seconds. Defaults to 30.
+        max_workers (int): Number of polls running concurrently. Defaults to 4.
+        rate (float, optional): Maximum number of HTTP requests per `per` seconds, None for no limit.
+            The limiter is installed on the session of api, so it also limits its other requests.
+        per (float): Length of the rate window in seconds. Defaults to 60.
+        device_sns (list, optional): Only poll these serial numbers.
+        rediscover_interval (int): Seconds between device discoveries. Defaults to 3600.
+    """
+
+    default_interval = 300
+
+    # ShinePhone device types and how to poll them
+    _shinephone_methods = {
+        'tlx': lambda api, device: api.tlx_system_status(device['plant_id'], device['device_sn']),
+        'mix': lambda api, device: api.mix_system_status(device['device_sn'], device['plant_id']),
+        'noah': lambda api, device: api.noah_system_status(device['device_sn']).get('obj', {}),
+    }
+    shinephone_device_types = tuple(_shinephone_methods)
+
+    def __init__(self, api, interval=300, jitter=30, max_workers=4, rate=None, per=60.0,
+                 device_sns=None, rediscover_interval=3600):
+        self.api = api
+        self.interval = interval
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(rate, per=per) if rate else None
+        if self.limiter is not None:
+            # Every HTTP request takes a token, e.g. device_list sends several
+            api.session.rate_limiter = self.limiter
+        self.device_sns = set(device_sns) if device_sns else None
+        self.rediscover_interval = rediscover_interval
+        self.devices = {}
+
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._emit_lock = threading.Lock()
+
+    @classmethod
+    def fetch_shinephone(cls, api, device):
+        """
+        Fetch the current data of a ShinePhone device, the way it is polled.
+
+        Args:
+            api (GrowattApi): Logged in GrowattApi client.
+            device (dict): 'device_sn', 'device_type' (one of shinephone_device_types) and 'plant_id'.
+
+        Returns:
+            dict: The data of the device.
+        """
+        try:
+            method = cls._shinephone_methods[device['device_type']]
+        except KeyError:
+            raise ValueError(f"device_type must be one of {', '.join(cls.shinephone_device_types)}")
+        return method(api, device)
+
+    def discover(self):
+        """
+        Find all pollable devices on the account.
+
+        Returns:
+            dict: Devices keyed by serial number, each a dict with 'device_sn',
+                'device_type', 'plant_id' and 'info' (the device_list entry).
+        """
+        devices = {}
+
+        if isinstance(self.api, OpenApiV1):
+            plants = self.api.plant_list() or {}
+            for plant in plants.get('plants', []):
+                device_data = self.api.device_list(plant['plant_id']) or {}
+                for device in device_data.get('devices', []):
+                    try:
+                        device_type = DeviceType(int(device['type']))
+                    except (KeyError, ValueError, TypeError):
+                        continue
+                    if device_type in OpenApiV1._device_methods:
+                        devices[device['device_sn']] = {
+                            'device_sn': device['device_sn'],
+                            'device_type': device_type.name.lower(),
+                            'plant_id': plant['plant_id'],
+                            'info': device,
+                        }
+        else:
+            if self.api.user_id is None:
+                raise ValueError("GrowattApi must be logged in before polling")
+            plants = self.api.plant_list(self.api.user_id) or {}
+            for plant in plants.get('data', []):
+                for device in self.api.device_list(plant['plantId']) or []:
+                    if device.get('deviceType') in self._shinephone_methods:
+                        devices[device['deviceSn']] = {
+                            'device_sn': device['deviceSn'],
+                            'device_type': device['deviceType'],
+                            'plant_id': plant['plantId'],
+                            'info': device,
+                        }
+
+        if self.device_sns is not None:
+            devices = {sn: device for sn, device in devices.items() if sn in self.device_sns}
+        return devices
+
+    def poll(self, device):
+        """
+        Fetch the current data of a single device.
+
+        Args:
+            device (dict): A device as returned by discover().
+
+        Returns:
+            dict: The normalized record, see the class documentation.
+        """
+        record = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'plant_id': device['plant_id'],
+            'device_sn': device['device_sn'],
+            'device_type': device['device_type'],
+        }
+        try:
+            if isinstance(self.api, OpenApiV1):
+                record['data'] = self.api.device_energy(device['device_sn'])
+            else:
+                record['data'] = self.fetch_shinephone(self.api, device)
+        except Exception as error:
+            logger.warning("Polling %s failed: %s", device['device_sn'], error)
+            record['data'] = None
+            record['error'] = str(error)
+        return record
+
+    def device_interval(self, device):
+        """
+        Seconds between polls of a device.
+        """
+        if isinstance(self.interval, dict):
+            return self.interval.get(device['device_type'], self.default_interval)
+        return self.interval
+
+    def next_poll(self, device, last_due):
+        """
+        Time (time.monotonic()) of the next poll of a device.
+
+        Args:
+            device (dict): The device.
+            last_due (float, optional): Time the previous poll was due, None for the first poll.
+        """
+        interval = self.device_interval(device)
+        if last_due is None:
+            return time.monotonic() + random.uniform(0, interval)
+        return max(time.monotonic(), last_due + interval + random.uniform(-self.jitter, self.jitter))
+
+    def _update_devices(self):
+        devices = self.discover()
+        with self._lock:
+            for device_sn, device in devices.items():
+                if device_sn not in self.devices:
+                    heapq.heappush(self._schedule, (self.next_poll(device, None), next(self._sequence), device_sn))
+            self.devices = devices
+        logger.info("Polling %d devices", len(devices))
+
+    def _poll_and_emit(self, device, callback):
+        try:
+            record = self.poll(device)
+            with self._emit_lock:
+                callback(record)
+        finally:
+            with self._lock:
+                self._in_flight.discard(device['device_sn'])
+
+    def run(self, callback, stop_event=None, max_polls=None):
+        """
+        Poll until stop_event is set, calling callback(record) for every poll.
+
+        Records are passed to the callback one at a time, it does not need to be thread safe.
+
+        Args:
+            callback (callable): Called with every record.
+            stop_event (threading.Event, optional): Stops polling when set.
+            max_polls (int, optional): Stop after this many polls have been started.
+        """
+        stop_event = stop_event or threading.Event()
+        self._update_devices()
+        next_discovery = time.monotonic() + self.rediscover_interval
+        polls = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not stop_event.is_set() and (max_polls is None or polls < max_polls):
+                now = time.monotonic()
+                if now >= next_discovery:
+                    try:
+                        self._update_devices()
+                    except Exception as error:
+                        logger.warning("Device discovery failed: %s", error)
+                    next_discovery = now + self.rediscover_interval
+
+                with self._lock:
+                    if not self._schedule:
+                        wait = next_discovery - now
+                    elif self._schedule[0][0] > now:
+                        wait = min(self._schedule[0][0], next_discovery) - now
+                    else:
+                        due, _, device_sn = heapq.heappop(self._schedule)
+                        device = self.devices.get(device_sn)
+                        if device is None:
+                            # Device disappeared from the account
+                            continue
+                        heapq.heappush(self._schedule, (self.next_poll(device, due), next(self._sequence), device_sn))
+                        if device_sn in self._in_flight:
+                            continue
+                        self._in_flight.add(device_sn)
+                        wait = None
+
+                if wait is not None:
+                    stop_event.wait(wait)
+                    continue
+
+                executor.submit(self._poll_and_emit, device, callback)
+                polls += 1
+
+
+class AdaptivePoller(Poller):
+    """
+    Poller that times every poll shortly after the device is expected to have uploaded new data.
+
+    Dataloggers upload about every `upload_period` seconds. The upload phase of every device
+    is learned from the 'last_update_time' of device_list and the sample time of the polled
+    data, and each poll is scheduled `upload_delay` seconds after the next expected upload, so
+    the same sample is not fetched twice. Devices flagged 'lost', or that keep returning
+    the same sample, are polled less often (up to `max_backoff` seconds between polls).
+
+    Takes the same arguments as Poller, plus:
+        upload_period (float): Seconds between uploads of a datalogger. Defaults to 300.
+        upload_delay (float): Seconds to wait after the expected upload. Defaults to 30.
+        lost_backoff (float): Interval multiplier for devices flagged lost. Defaults to 6.
+        max_backoff (float): Maximum seconds between polls of a lost or stale device. Defaults to 3600.
+    """
+
+    # Fields containing the time of the last upload or the polled sample
+    time_fields = ('last_update_time', 'lastUpdateTime', 'time', 'calendar')
+
+    def __init__(self, api, upload_period=300, upload_delay=30, lost_backoff=6, max_backoff=3600, **kwargs):
+        super().__init__(api, **kwargs)
+        self.upload_period = upload_period
+        self.upload_delay = upload_delay
+        self.lost_backoff = lost_backoff
+        self.max_backoff = max_backoff
+        # device_sn -> {'phase': upload phase in seconds, 'sample': last sample time, 'stale': repeated samples}
+        self._uploads = {}
+        self._uploads_lock = threading.Lock()
+
+    @classmethod
+    def _sample_time(cls, data):
+        """
+        The upload/sample time in a device_list entry or polled data as seconds, None if unknown.
+
+        The time is in the local time of the plant, which only shifts it by whole multiples of
+        the upload period for common time zones, so it is read as UTC.
+        """
+        for field in cls.time_fields:
+            value = (data or {}).get(field)
+            if isinstance(value, str):
+                try:
+                    sample = datetime.datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S')
+                except ValueError:
+                    continue
+                return sample.replace(tzinfo=datetime.timezone.utc).timestamp()
+        return None
+
+    def _learn(self, device_sn, data, polled):
+        """
+        Update the upload phase of a device from a device_list entry or polled data.
+        Polled data returning the same sample as the previous poll counts as stale.
+        """
+        sample = self._sample_time(data)
+        if sample is None:
+            return
+        with self._uploads_lock:
+            upload = self._uploads.setdefault(device_sn, {'phase': None, 'sample': None, 'stale': 0})
+            if polled and upload['sample'] == sample:
+                upload['stale'] += 1
+            elif polled or upload['sample'] is None or sample > upload['sample']:
+                upload.update(phase=sample % self.upload_period, sample=sample, stale=0)
+
+    def discover(self):
+        devices = super().discover()
+        for device_sn, device in devices.items():
+            self._learn(device_sn, device['info'], polled=False)
+        return devices
+
+    def poll(self, device):
+        record = super().poll(device)
+        if record['data']:
+            self._learn(device['device_sn'], record['data'], polled=True)
+        return record
+
+    def device_interval(self, device):
+        base = super().device_interval(device)
+        with self._uploads_lock:
+            stale = self._uploads.get(device['device_sn'], {}).get('stale', 0)
+
+        interval = base
+        if device['info'].get('lost') in (True, 1, '1', 'true'):
+            interval = base * self.lost_backoff
+        elif stale:
+            interval = base * 2 ** stale
+        return min(interval, max(self.max_backoff, base))
+
+    def next_poll(self, device, last_due):
+        with self._uploads_lock:
+            phase = self._uploads.get(device['device_sn'], {}).get('phase')
+        if phase is None:
+            return super().next_poll(device, last_due)
+
+        now, wall_now = time.monotonic(), time.time()
+        if last_due is None:
+            earliest = wall_now
+        else:
+            earliest = max(wall_now, last_due - now + wall_now + self.device_interval(device) - self.upload_period / 2)
+
+        # First expected upload at or after earliest, plus the delay for it to be processed
+        upload = earliest + (phase - earliest) % self.upload_period
+        return now + (upload + self.upload_delay - wall_now)
@@ -0,0 +1,58 @@
+"""
+Request rate limiting for the growattServer library.
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread safe token bucket limiting how often requests may be started.
+
+    Args:
+        rate (float): Number of requests allowed per `per` seconds.
+        per (float): Length of the rate window in seconds. Defaults to 60.
+        burst (int): Number of requests that may be started back to back. Defaults to 1.
+    """
+
+    def __init__(self, rate, per=60.0, burst=1):
+        if rate <= 0 or per <= 0 or burst < 1:
+            raise ValueError("rate and per must be positive and burst at least 1")
+        self.interval = per / rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+        self._updated = now
+
+    def delay(self):
+        """
+        Seconds until a request may be started, 0 if one may be started right away.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) * self.interval)
+
+    def try_acquire(self):
+        """
+        Take a token if one is available.
+
+        Returns:
+            bool: True if a request may be started now.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """
+        Block until a request may be started and take a token.
+        """
+        while not self.try_acquire():
+            time.sleep(self.delay())
@@ -0,0 +1,324 @@
+"""
+Incremental evaluation of alert rules on polled device data.
+"""
+import datetime
+import operator
+import threading
+
+from .units import parse_value
+
+_OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+_TRUE = (True, 1, '1', 'true', 'True')
+
+
+class _UnsetType:
+    """
+    Marker for fields that were never read, differs from every value including None.
+    """
+
+    def __repr__(self):
+        return '<unset>'
+
+
+_Unset = _UnsetType()
+
+
+def _accessor(field):
+    """
+    Compile a field name, or a dotted path like 'obj.soc' for nested data, into a getter.
+    """
+    keys = field.split('.')
+    if len(keys) == 1:
+        return operator.methodcaller('get', field)
+
+    def get(data):
+        for key in keys:
+            if not isinstance(data, dict):
+                return None
+            data = data.get(key)
+        return data
+    return get
+
+
+def _number(value):
+    """
+    Convert a value to a float, parsing units when needed, None if it is not numeric.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        parsed = parse_value(value)
+        return parsed[0] if parsed else None
+
+
+def _boolean(value):
+    return value in _TRUE
+
+
+def _identity(value):
+    return value
+
+
+def _coercion(threshold):
+    """
+    The conversion of values compared with a threshold: to numbers for numeric thresholds and
+    to booleans for boolean thresholds.
+    """
+    if isinstance(threshold, bool):
+        return _boolean
+    if isinstance(threshold, (int, float)):
+        return _number
+    return _identity
+
+
+class Rule:
+    """
+    An alert rule on one or more fields of the data of a device.
+
+    A rule is active while its condition holds. With a clear_value, an active rule only
+    clears once the condition no longer holds for the clear_value, so values hovering around
+    the threshold do not toggle it (hysteresis), e.g. Rule('low_soc', 'soc', '<', 20, clear_value=25).
+
+    Args:
+        name (str): Name of the rule, reported in the events.
+        field (str or tuple): The field (or dotted path into nested data) the rule checks, or a
+            tuple of fields for a callable condition.
+        op (str or callable): '<', '<=', '>', '>=', '==', '!=', 'changed' (an event on every
+            change of the value), or a callable called with the values of the fields that
+            returns whether the rule is active.
+        value: The threshold compared with the field. Values are converted to numbers for
+            numeric thresholds and to booleans for boolean thresholds.
+        clear_value (optional): Threshold that clears an active rule. Defaults to value.
+        device_types (iterable, optional): Only evaluate the rule for these device types.
+        hours (tuple, optional): (start, end) local hours the rule is evaluated in, e.g. (11, 14)
+            for "PV zero at noon". Such rules are evaluated on every update, outside the hours
+            they are inactive.
+    """
+
+    def __init__(self, name, field, op, value=None, clear_value=None, device_types=None, hours=None):
+        self.name = name
+        self.fields = tuple(field) if isinstance(field, (tuple, list)) else (field,)
+        self.op = op
+        self.value = value
+        self.clear_value = value if clear_value is None else clear_value
+        self.device_types = frozenset(device_types) if device_types else None
+        self.hours = hours
+        self._compare = None
+        if not callable(op) and op != 'changed':
+            if op not in _OPERATORS:
+                raise ValueError(f"Unknown operator {op}")
+            if len(self.fields) != 1:
+                raise ValueError("Comparison rules check a single field")
+            self._compare = _OPERATORS[op]
+            self._coerce = _coercion(value)
+
+    def check(self, values, active):
+        """
+        Whether the rule is active for the values of its fields, given whether it was active before.
+        """
+        if self._compare is None:
+            return callable(self.op) and bool(self.op(*values))
+        value = self._coerce(values[0])
+        if value is None:
+            return False
+        try:
+            return self._compare(value, self.clear_value if active else self.value)
+        except TypeError:
+            return False
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, {self.fields!r}, {self.op!r}, {self.value!r})"
+
+
+class RuleEngine:
+    """
+    Evaluate many rules on the data of many devices, only re-evaluating rules whose fields changed.
+
+    Rules are compiled once into field accessors. For every update of a device the fields
+    referenced by any rule are read and compared with the previous update; only the rules
+    referencing a changed field (and rules with hours) are evaluated. The state of every
+    rule is kept per device, and an event is produced when a rule becomes active or clears:
+        'rule' -- The name of the rule
+        'device_sn' -- The serial number of the device
+        'state' -- 'triggered', 'cleared' or 'changed' (for 'changed' rules)
+        'values' -- The values of the fields of the rule
+        'previous' -- The previous values of the fields of the rule
+
+    Args:
+        rules (iterable): The rules.
+        callback (callable, optional): Called with every event.
+
+    Example:
+        engine = RuleEngine([
+            Rule('offline', 'lost', '==', True),
+            Rule('status', 'status', 'changed'),
+            Rule('low_soc', 'bdc1Soc', '<', 20, clear_value=25),
+            Rule('no_pv_at_noon', 'ppv', '<=', 0, hours=(11, 14)),
+        ], callback=print)
+        poller.run(engine.update_record)
+    """
+
+    def __init__(self, rules=(), callback=None):
+        self.callback = callback
+        self.rules = []
+        self._fields = []
+        self._field_index = {}
+        self._accessors = []
+        # Whether any field is a path into nested data
+        self._nested = False
+        # Field index -> indexes of the rules referencing the field
+        self._by_field = []
+        # Rule index -> field indexes of the rule
+        self._rule_fields = []
+        self._always = []
+        # device_sn -> (field values, set of active rule indexes, set of rule indexes added since
+        # the last update, which are evaluated on the next update regardless of changes)
+        self._devices = {}
+        self._lock = threading.Lock()
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule):
+        """
+        Add a rule. It is evaluated for every device on its next update.
+        """
+        with self._lock:
+            rule_index = len(self.rules)
+            self.rules.append(rule)
+            field_indexes = []
+            for field in rule.fields:
+                index = self._field_index.get(field)
+                if index is None:
+                    index = self._field_index[field] = len(self._fields)
+                    self._fields.append(field)
+                    self._accessors.append(_accessor(field))
+                    self._nested = self._nested or '.' in field
+                    self._by_field.append([])
+                self._by_field[index].append(rule_index)
+                field_indexes.append(index)
+            self._rule_fields.append(tuple(field_indexes))
+            if rule.hours is not None:
+                self._always.append(rule_index)
+            # Evaluate the new rule on the next update of every known device, without making
+            # the rules sharing its fields see them as changed
+            for values, active, pending in self._devices.values():
+                pending.add(rule_index)
+
+    def evaluate(self, device_sn, data, device_type=None, now=None):
+        """
+        Evaluate the rules for a new update of a device.
+
+        Args:
+            device_sn (str): The serial number of the device.
+            data (dict): The device data.
+            device_type (str, optional): The device type, for rules limited to device types.
+            now (datetime.datetime, optional): Local time used for rules with hours. Defaults to now.
+
+        Returns:
+            list: The events of this update, see the class documentation.
+        """
+        data = data or {}
+        events = []
+        with self._lock:
+            if self._nested:
+                new = [get(data) for get in self._accessors]
+            else:
+                new = list(map(data.get, self._fields))
+            state = self._devices.get(device_sn)
+            if state is None:
+                state = self._devices[device_sn] = ([_Unset] * len(new), set(), set())
+            old, active, pending = state
+            if new == old and not self._always and not pending:
+                # Nothing any rule looks at changed
+                return events
+            old.extend([_Unset] * (len(new) - len(old)))
+
+            candidates = set(self._always)
+            candidates.update(pending)
+            pending.clear()
+            for index, value in enumerate(new):
+                if value != old[index]:
+                    candidates.update(self._by_field[index])
+            if not candidates:
+                return events
+
+            hour = None
+            rules, rule_fields = self.rules, self._rule_fields
+            for rule_index in sorted(candidates):
+                rule = rules[rule_index]
+                if rule.device_types is not None and device_type not in rule.device_types:
+                    continue
+                field_indexes = rule_fields[rule_index]
+                values = [new[index] for index in field_indexes]
+
+                if rule.op == 'changed':
+                    if (any(old[index] is not _Unset for index in field_indexes) and
+                            any(new[index] != old[index] for index in field_indexes)):
+                        events.append(self._event(rule, device_sn, 'changed', values, old, field_indexes))
+                    continue
+
+                in_hours = True
+                if rule.hours is not None:
+                    if hour is None:
+                        hour = (now or datetime.datetime.now()).hour
+                    start, end = rule.hours
+                    in_hours = start <= hour < end if start <= end else (hour >= start or hour < end)
+
+                was_active = rule_index in active
+                is_active = in_hours and rule.check(values, was_active)
+                if is_active != was_active:
+                    if is_active:
+                        active.add(rule_index)
+                    else:
+                        active.discard(rule_index)
+                    events.append(self._event(rule, device_sn, 'triggered' if is_active else 'cleared',
+                                              values, old, field_indexes))
+
+            state[0][:] = new
+
+        if self.callback is not None:
+            for event in events:
+                self.callback(event)
+        return events
+
+    @staticmethod
+    def _event(rule, device_sn, state, values, old, field_indexes):
+        previous = [None if old[index] is _Unset else old[index] for index in field_indexes]
+        return {'rule': rule.name, 'device_sn': device_sn, 'state': state, 'values': values, 'previous': previous}
+
+    def update_record(self, record):
+        """
+        Evaluate the rules for a Poller record, records of failed polls are ignored.
+
+        Returns:
+            list: The events of this update.
+        """
+        if record.get('data') is None:
+            return []
+        return self.evaluate(record['device_sn'], record['data'], record.get('device_type'))
+
+    def active(self, device_sn=None):
+        """
+        The names of the active rules of a device, or device_sn -> names for all devices.
+        """
+        with self._lock:
+            if device_sn is not None:
+                state = self._devices.get(device_sn)
+                return sorted(self.rules[index].name for index in state[1]) if state else []
+            return {sn: sorted(self.rules[index].name for index in state[1])
+                    for sn, state in self._devices.items() if state[1]}
+
+    def remove(self, device_sn):
+        """
+        Forget the state of a device.
+        """
+        with self._lock:
+            self._devices.pop(device_sn, None)
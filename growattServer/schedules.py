@@ -0,0 +1,345 @@
+"""
+Parsing and validation of the time segments and charge/discharge periods in MIN and SPH settings.
+"""
+from functools import lru_cache
+
+from .exceptions import GrowattParameterError
+
+MINUTES_PER_DAY = 24 * 60
+
+MODE_NAMES = {
+    0: "Load First",
+    1: "Battery First",
+    2: "Grid First",
+}
+
+# Name -> (ID field of the records, number of segments, start, stop, switch and mode field templates)
+LAYOUTS = {
+    'min': ('segment_id', 9, 'forcedTimeStart{}', 'forcedTimeStop{}', 'forcedStopSwitch{}', 'time{}Mode'),
+    'sph_charge': ('period_id', 3, 'forcedChargeTimeStart{}', 'forcedChargeTimeStop{}',
+                   'forcedChargeStopSwitch{}', None),
+    'sph_discharge': ('period_id', 3, 'forcedDischargeTimeStart{}', 'forcedDischargeTimeStop{}',
+                      'forcedDischargeStopSwitch{}', None),
+}
+
+
+@lru_cache(maxsize=None)
+def _fields(layout):
+    """
+    The settings field names of every segment of a layout, formatted once.
+    """
+    id_field, count, start, stop, switch, mode = LAYOUTS[layout]
+    return id_field, tuple(
+        (i, start.format(i), stop.format(i), switch.format(i), mode.format(i) if mode else None)
+        for i in range(1, count + 1)
+    )
+
+
+@lru_cache(maxsize=4096)
+def _parse_time(value):
+    """
+    Parse a 'H:M' time into (minutes since midnight, 'HH:MM'), (0, '00:00') if it is missing or invalid.
+    """
+    try:
+        hour, minute = value.split(":")[:2]
+        hour, minute = int(hour), int(minute)
+    except (AttributeError, ValueError):
+        return 0, "00:00"
+    return hour * 60 + minute, f"{hour:02d}:{minute:02d}"
+
+
+@lru_cache(maxsize=256)
+def _parse_int(value):
+    """
+    Parse an integer setting, None if it is missing, 'null' or invalid.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_segments(settings_data, id_field, fields, parse_time, parse_int):
+    get = settings_data.get
+    segments = []
+    for i, start_field, stop_field, switch_field, mode_field in fields:
+        start_minute, start_time = parse_time(get(start_field))
+        end_minute, end_time = parse_time(get(stop_field))
+        segment = {id_field: i}
+        if mode_field is not None:
+            batt_mode = parse_int(get(mode_field))
+            segment['batt_mode'] = batt_mode
+            segment['mode_name'] = MODE_NAMES.get(batt_mode, "Unknown")
+        segment['start_time'] = start_time
+        segment['end_time'] = end_time
+        segment['start_minute'] = start_minute
+        segment['end_minute'] = end_minute
+        segment['enabled'] = parse_int(get(switch_field)) == 1
+        segments.append(segment)
+    return segments
+
+
+def parse_time_segments(settings_data, layout='min'):
+    """
+    Parse the time segments or periods in settings data.
+
+    Args:
+        settings_data (dict): Settings data from min_settings (layout 'min') or sph_detail
+            (layouts 'sph_charge' and 'sph_discharge').
+        layout (str): 'min', 'sph_charge' or 'sph_discharge'. Defaults to 'min'.
+
+    Returns:
+        list: A dictionary per segment containing:
+            - segment_id (int) for 'min', period_id (int) for the SPH layouts
+            - batt_mode (int) and mode_name (str), only for 'min'
+            - start_time (str): Start time in format "HH:MM"
+            - end_time (str): End time in format "HH:MM"
+            - start_minute (int): Start time in minutes since midnight
+            - end_minute (int): End time in minutes since midnight
+            - enabled (bool): Whether the segment is enabled
+    """
+    id_field, fields = _fields(layout)
+    try:
+        return _parse_segments(settings_data, id_field, fields, _parse_time, _parse_int)
+    except TypeError:
+        # An unhashable value (e.g. a list in a malformed payload) can not be looked up in the caches
+        return _parse_segments(settings_data, id_field, fields, _parse_time.__wrapped__, _parse_int.__wrapped__)
+
+
+@lru_cache(maxsize=None)
+def _field_names(layout):
+    """
+    All settings fields read for a layout.
+    """
+    return tuple(name for segment in _fields(layout)[1] for name in segment[1:] if name is not None)
+
+
+def parse_time_segments_batch(settings_list, layout='min'):
+    """
+    Parse the time segments or periods of many devices at once.
+
+    Devices sharing a schedule (all segments disabled, a common tariff window, ...) are only
+    parsed once, the other devices get a copy of the parsed segments.
+
+    Args:
+        settings_list (iterable): Settings data of every device, see parse_time_segments().
+        layout (str): 'min', 'sph_charge' or 'sph_discharge'. Defaults to 'min'.
+
+    Returns:
+        list: The parse_time_segments() result of every settings dict, in the same order.
+    """
+    names = _field_names(layout)
+    # Raw values of the segment fields -> segments parsed from them. The first device gets the
+    # parsed segments themselves, which is safe because the others are copied before returning.
+    parsed = {}
+    results = []
+    for settings_data in settings_list:
+        raw = tuple(map(settings_data.get, names))
+        try:
+            segments = parsed.get(raw)
+        except TypeError:
+            results.append(parse_time_segments(settings_data, layout))
+            continue
+        if segments is None:
+            segments = parsed[raw] = parse_time_segments(settings_data, layout)
+            results.append(segments)
+        else:
+            results.append([segment.copy() for segment in segments])
+    return results
+
+
+def _minute(segment, field):
+    """
+    The start ('start') or end ('end') of a segment in minutes since midnight, from its
+    '<field>_minute' value or its '<field>_time' (datetime.time or "HH:MM").
+    """
+    minute = segment.get(f'{field}_minute')
+    if minute is not None:
+        return minute
+    value = segment[f'{field}_time']
+    if isinstance(value, str):
+        return _parse_time(value)[0]
+    return value.hour * 60 + value.minute
+
+
+def minute_mask(start_minute, end_minute):
+    """
+    Bit mask of the minutes from start_minute up to (not including) end_minute.
+
+    Bit n is minute n of the day. Spans ending before they start wrap around midnight,
+    spans starting and ending at the same minute are empty.
+    """
+    start_minute %= MINUTES_PER_DAY
+    end_minute = end_minute % MINUTES_PER_DAY if end_minute != MINUTES_PER_DAY else MINUTES_PER_DAY
+    if start_minute <= end_minute:
+        return ((1 << (end_minute - start_minute)) - 1) << start_minute
+    return (((1 << (MINUTES_PER_DAY - start_minute)) - 1) << start_minute) | ((1 << end_minute) - 1)
+
+
+def mask_ranges(mask):
+    """
+    Turn a minute mask into a list of ("HH:MM", "HH:MM") ranges, the end not included.
+    """
+    ranges = []
+    minute = 0
+    while mask:
+        # Skip to the next set bit, then to the end of its run
+        skip = (mask & -mask).bit_length() - 1
+        mask >>= skip
+        minute += skip
+        length = (~mask & (mask + 1)).bit_length() - 1
+        mask >>= length
+        ranges.append((f"{minute // 60:02d}:{minute % 60:02d}",
+                       f"{(minute + length) // 60:02d}:{(minute + length) % 60:02d}"))
+        minute += length
+    return ranges
+
+
+class Schedule:
+    """
+    A day schedule encoded as one 1440-bit minute mask per battery mode.
+
+    Overlap, coverage and diff of schedules are a few integer operations, independent of the
+    number of segments, so schedules of a whole fleet can be compared cheaply.
+
+    Args:
+        masks (dict, optional): Battery mode -> minute mask, see minute_mask().
+
+    Example:
+        segments = parse_time_segments_batch(settings_list)
+        schedules = [Schedule.from_segments(device_segments) for device_segments in segments]
+        unchanged = [not schedule.diff(schedules[0]) for schedule in schedules]
+    """
+
+    def __init__(self, masks=None):
+        self.masks = {mode: mask for mode, mask in (masks or {}).items() if mask}
+
+    @classmethod
+    def from_segments(cls, segments, mode=None):
+        """
+        Build the schedule of the enabled segments or periods.
+
+        Args:
+            segments (list): Segments as returned by parse_time_segments() or min_read_time_segments(),
+                or as passed to min_write_time_segments() and sph_write_ac_*_times().
+            mode (optional): Mode of all segments, e.g. 'charge' for SPH periods. Defaults to
+                the 'batt_mode' of every segment.
+        """
+        schedule = cls()
+        for segment in segments:
+            if segment.get('enabled', True):
+                schedule.add(segment['batt_mode'] if mode is None else mode,
+                             _minute(segment, 'start'), _minute(segment, 'end'))
+        return schedule
+
+    def add(self, mode, start_minute, end_minute):
+        """
+        Add a span to the schedule.
+
+        Returns:
+            int: Mask of the minutes of the span that were already scheduled (in any mode).
+        """
+        mask = minute_mask(start_minute, end_minute)
+        overlap = mask & self.mask()
+        if mask:
+            self.masks[mode] = self.masks.get(mode, 0) | mask
+        return overlap
+
+    def mask(self, mode=None):
+        """
+        Mask of the minutes scheduled in a mode, or in any mode when mode is None.
+        """
+        if mode is not None:
+            return self.masks.get(mode, 0)
+        combined = 0
+        for mask in self.masks.values():
+            combined |= mask
+        return combined
+
+    def coverage(self, mode=None):
+        """
+        Number of minutes scheduled in a mode, or in any mode when mode is None.
+        """
+        return self.mask(mode).bit_count()
+
+    def overlap(self, other):
+        """
+        Mask of the minutes scheduled in both schedules (in any mode).
+        """
+        return self.mask() & other.mask()
+
+    def conflicts(self, other):
+        """
+        Mask of the minutes both schedules schedule in a different mode.
+        """
+        same = 0
+        for mode, mask in self.masks.items():
+            same |= mask & other.masks.get(mode, 0)
+        return self.overlap(other) & ~same
+
+    def diff(self, other):
+        """
+        The minutes that differ from another schedule.
+
+        Returns:
+            dict: Mode -> (added, removed) masks of the minutes scheduled in that mode in this
+                schedule but not in other, and the other way around. Modes without
+                differences are left out, so equal schedules return an empty dict.
+        """
+        differences = {}
+        for mode in self.masks.keys() | other.masks.keys():
+            mine, theirs = self.masks.get(mode, 0), other.masks.get(mode, 0)
+            if mine != theirs:
+                differences[mode] = (mine & ~theirs, theirs & ~mine)
+        return differences
+
+    def __eq__(self, other):
+        return isinstance(other, Schedule) and self.masks == other.masks
+
+    def __repr__(self):
+        return f"Schedule({ {mode: mask_ranges(mask) for mode, mask in self.masks.items()} })"
+
+
+def find_overlaps(segments, id_field='segment_id'):
+    """
+    Find the enabled segments or periods that overlap each other.
+
+    Args:
+        segments (list): Segments, see Schedule.from_segments().
+        id_field (str): Field identifying the segments, their position (starting at 1) is
+            used for segments without it. Defaults to 'segment_id'.
+
+    Returns:
+        list: (id, id, overlapping ranges) tuples for every overlapping pair.
+    """
+    masks = [(segment.get(id_field, position), minute_mask(_minute(segment, 'start'), _minute(segment, 'end')))
+             for position, segment in enumerate(segments, start=1) if segment.get('enabled', True)]
+    overlaps = []
+    for index, (first_id, first_mask) in enumerate(masks):
+        for second_id, second_mask in masks[index + 1:]:
+            if first_mask & second_mask:
+                overlaps.append((first_id, second_id, mask_ranges(first_mask & second_mask)))
+    return overlaps
+
+
+def validate_segments(segments, id_field='segment_id', changed=None):
+    """
+    Check that the enabled segments or periods of a schedule do not overlap.
+
+    Args:
+        segments (list): Segments, see Schedule.from_segments().
+        id_field (str): Field identifying the segments. Defaults to 'segment_id'.
+        changed (iterable, optional): IDs of the segments being written. Only overlaps involving
+            one of them are reported, so existing overlaps do not block writes. Defaults to all segments.
+
+    Raises:
+        GrowattParameterError: If enabled segments overlap.
+    """
+    overlaps = find_overlaps(segments, id_field)
+    if changed is not None:
+        changed = set(changed)
+        overlaps = [overlap for overlap in overlaps if overlap[0] in changed or overlap[1] in changed]
+    if overlaps:
+        raise GrowattParameterError("Overlapping time segments: " + ", ".join(
+            f"{first_id} and {second_id} ({', '.join(f'{start}-{end}' for start, end in ranges)})"
+            for first_id, second_id, ranges in overlaps))
@@ -0,0 +1,191 @@
+"""
+Selection of the fastest healthy regional Growatt server.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVERS = (
+    'https://openapi.growatt.com/',
+    'https://openapi-us.growatt.com/',
+    'https://openapi-cn.growatt.com/',
+)
+
+
+class ServerSelector:
+    """
+    Pick the fastest healthy server out of a list of candidate base URLs and fail over when it errors.
+
+    Every candidate is probed with a single GET of its base URL. Servers that do not respond
+    or respond with a 5XX status are unhealthy, of the others the one that responded fastest
+    is selected. Candidates are probed again every `reprobe_interval` seconds. After
+    `failure_threshold` consecutive failed requests (connection errors, timeouts and 5XX
+    responses) to the selected server, the next fastest healthy server is selected.
+
+    Use it through GrowattApi.select_server(), which also sends all requests of the client to
+    the selected server. All candidates must serve the account, a ShinePhone client is
+    logged in again automatically after a failover.
+
+    Args:
+        servers (list): Candidate base URLs. Defaults to DEFAULT_SERVERS.
+        probe_timeout (float): Seconds to wait for a probe response. Defaults to 5.
+        reprobe_interval (float): Seconds between probes of all candidates. Defaults to 3600.
+        failure_threshold (int): Consecutive failed requests that trigger a failover. Defaults to 3.
+        on_change (callable, optional): Called with the new base URL whenever another server is selected.
+    """
+
+    def __init__(self, servers=DEFAULT_SERVERS, probe_timeout=5.0, reprobe_interval=3600, failure_threshold=3,
+                 on_change=None):
+        if not servers:
+            raise ValueError("At least one server is required")
+        self.servers = [server if server.endswith('/') else server + '/' for server in servers]
+        self.probe_timeout = probe_timeout
+        self.reprobe_interval = reprobe_interval
+        self.failure_threshold = failure_threshold
+        self.on_change = on_change
+        self.current = None
+        # Base URL -> latency of the last probe in seconds, None if the server was unhealthy
+        self.latencies = {}
+
+        self._failures = 0
+        self._next_probe = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._probe_session = requests.Session()
+
+    def probe_server(self, server):
+        """
+        Probe a single server.
+
+        Returns:
+            float: The response time in seconds, None if the server is unhealthy.
+        """
+        started = time.monotonic()
+        try:
+            response = self._probe_session.get(server, timeout=self.probe_timeout, allow_redirects=False)
+            response.close()
+        except requests.exceptions.RequestException as error:
+            logger.debug("Probing %s failed: %s", server, error)
+            return None
+        if response.status_code >= 500:
+            return None
+        return time.monotonic() - started
+
+    def probe(self):
+        """
+        Probe all candidates concurrently and select the fastest healthy one.
+
+        The selected server is kept when no candidate is healthy.
+
+        Returns:
+            str: The base URL of the selected server.
+        """
+        with ThreadPoolExecutor(max_workers=len(self.servers)) as executor:
+            latencies = dict(zip(self.servers, executor.map(self.probe_server, self.servers)))
+
+        with self._lock:
+            self.latencies = latencies
+            self._next_probe = time.monotonic() + self.reprobe_interval
+            self._probing = False
+            self._select(self._fastest() or self.current or self.servers[0])
+            return self.current
+
+    def _fastest(self, exclude=None):
+        healthy = [(latency, server) for server, latency in self.latencies.items()
+                   if latency is not None and server != exclude]
+        return min(healthy)[1] if healthy else None
+
+    def _select(self, server):
+        """
+        Select a server, must be called with the lock held.
+        """
+        self._failures = 0
+        if server == self.current:
+            return
+        logger.info("Selected Growatt server %s (%s)", server,
+                    "unprobed" if self.latencies.get(server) is None else f"{self.latencies[server] * 1000:.0f} ms")
+        self.current = server
+        if self.on_change is not None:
+            self.on_change(server)
+
+    def server_url(self):
+        """
+        The base URL of the selected server, probing the candidates first when they are due.
+        Only one thread probes, other threads keep using the selected server meanwhile.
+        """
+        with self._lock:
+            due = time.monotonic() >= self._next_probe and not self._probing
+            if due:
+                self._probing = True
+            current = self.current
+        if not due:
+            return current
+        try:
+            return self.probe()
+        except Exception as error:
+            with self._lock:
+                self._probing = False
+                self._next_probe = time.monotonic() + self.reprobe_interval
+            if current is None:
+                raise
+            logger.warning("Probing Growatt servers failed: %s", error)
+            return current
+
+    def resolve(self, url):
+        """
+        Rewrite a URL on any of the candidates to the selected server.
+        """
+        for server in self.servers:
+            if url.startswith(server):
+                return self.server_url() + url[len(server):]
+        return url
+
+    def alternative(self, url):
+        """
+        Rewrite a URL on one of the candidates to the next best other candidate, for retrying a
+        request that could not reach its server: the fastest other healthy server, or else the
+        next candidate in the list.
+
+        Returns:
+            str: The rewritten URL, None if the URL is not on a candidate or there is no other candidate.
+        """
+        for server in self.servers:
+            if url.startswith(server):
+                break
+        else:
+            return None
+        with self._lock:
+            fallback = self._fastest(exclude=server)
+        if fallback is None and len(self.servers) > 1:
+            fallback = self.servers[(self.servers.index(server) + 1) % len(self.servers)]
+        if fallback is None or fallback == server:
+            return None
+        return fallback + url[len(server):]
+
+    def record(self, url, success):
+        """
+        Record the outcome of a request, failing over after failure_threshold consecutive failures.
+        """
+        with self._lock:
+            if self.current is None or not url.startswith(self.current):
+                return
+            if success:
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._failures < self.failure_threshold:
+                return
+
+            failed = self.current
+            self.latencies[failed] = None
+            fallback = self._fastest(exclude=failed)
+            if fallback is None:
+                # Nothing known to be healthy, try the next candidate
+                fallback = self.servers[(self.servers.index(failed) + 1) % len(self.servers)]
+            logger.warning("Growatt server %s keeps failing, failing over to %s", failed, fallback)
+            self._select(fallback)
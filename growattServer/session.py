@@ -0,0 +1,203 @@
+"""
+HTTP session used by the growattServer API clients.
+"""
+import logging
+import threading
+import time
+
+import requests
+
+from .circuit_breaker import CircuitBreaker
+from .exceptions import GrowattCircuitOpenError, GrowattDeadlineExceededError
+from .timeouts import current_deadline, current_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class GrowattSession(requests.Session):
+    """
+    requests.Session that every request of the API clients goes through.
+
+    Besides the standard keyword arguments of requests.Session.request it accepts:
+        relogin (bool): Whether an expired login session may be renewed and the request
+            replayed (see expired_session_handler). Defaults to True.
+
+    Set circuit_breaker to a CircuitBreaker to fail fast while the server is failing,
+    server_selector to a ServerSelector to send requests to the fastest healthy server, and
+    rate_limiter to a RateLimiter to limit how often HTTP requests are sent. Every request
+    takes a token, including the ones of methods that send several (e.g. device_list),
+    re-logins and retries on another server.
+
+    Requests without an explicit timeout use the session timeout, limited by the remaining
+    budget of the current deadline() block.
+
+    The bytes received on the wire and after decompression are counted per endpoint, see
+    transfer_stats(). Compressed responses are already requested by requests' default
+    Accept-Encoding header.
+    """
+
+    # Default (connect, read) timeout in seconds
+    default_timeout = (10, 60)
+
+    def __init__(self):
+        super().__init__()
+        self.timeout = self.default_timeout
+        self.circuit_breaker = None
+        self.server_selector = None
+        self.rate_limiter = None
+        # Called as handler(response, started) after every request, returns True when the
+        # login session had expired and was renewed so the request should be replayed.
+        # started is the time.monotonic() value from before the request was sent.
+        self.expired_session_handler = None
+
+        # Endpoint -> transfer counters, see transfer_stats()
+        self._transfers = {}
+        self._transfers_lock = threading.Lock()
+
+    @staticmethod
+    def _limit_timeout(timeout, remaining):
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(remaining if part is None else min(part, remaining) for part in timeout)
+        return min(timeout, remaining)
+
+    def _send(self, method, url, *args, **kwargs):
+        limiter = self.rate_limiter
+        if limiter is not None:
+            # Before the deadline check, waiting for a token counts against the deadline
+            limiter.acquire()
+
+        timeout = kwargs.get('timeout')
+        if timeout is None:
+            timeout = current_timeout(self.timeout)
+
+        expires = current_deadline()
+        if expires is not None:
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                raise GrowattDeadlineExceededError(f"Deadline exceeded before sending request to {url}")
+            timeout = self._limit_timeout(timeout, remaining)
+        kwargs['timeout'] = timeout
+
+        try:
+            response = self._send_protected(method, url, *args, **kwargs)
+        except requests.exceptions.Timeout as error:
+            if expires is not None and time.monotonic() >= expires:
+                raise GrowattDeadlineExceededError(f"Deadline exceeded during request to {url}") from error
+            raise
+
+        if not kwargs.get('stream'):
+            self._record_transfer(url, kwargs.get('params'), response)
+        return response
+
+    def _record_transfer(self, url, params, response):
+        """
+        Count the compressed (wire) and decompressed size of a fully read response.
+        """
+        decompressed = len(response.content)
+        try:
+            # Bytes urllib3 read from the connection, before decoding
+            compressed = response.raw.tell()
+        except (AttributeError, OSError):
+            compressed = 0
+        if not compressed:
+            compressed = int(response.headers.get('Content-Length') or decompressed)
+
+        endpoint = CircuitBreaker.keys(url, params)[1]
+        encoding = response.headers.get('Content-Encoding', 'identity')
+        with self._transfers_lock:
+            stats = self._transfers.get(endpoint)
+            if stats is None:
+                stats = self._transfers[endpoint] = {
+                    'requests': 0, 'compressed_bytes': 0, 'decompressed_bytes': 0, 'encodings': {}}
+            stats['requests'] += 1
+            stats['compressed_bytes'] += compressed
+            stats['decompressed_bytes'] += decompressed
+            stats['encodings'][encoding] = stats['encodings'].get(encoding, 0) + 1
+
+    def transfer_stats(self, reset=False):
+        """
+        Transfer sizes of the responses received so far, per endpoint (URL path plus 'op' parameter).
+
+        Args:
+            reset (bool): Start counting from zero again. Defaults to False.
+
+        Returns:
+            dict: Endpoint -> dict with:
+                - requests (int): Number of responses
+                - compressed_bytes (int): Bytes received on the wire
+                - decompressed_bytes (int): Bytes after decompression
+                - encodings (dict): Content-Encoding -> number of responses
+        """
+        with self._transfers_lock:
+            stats = {endpoint: dict(counters, encodings=dict(counters['encodings']))
+                     for endpoint, counters in self._transfers.items()}
+            if reset:
+                self._transfers.clear()
+        return stats
+
+    def _send_protected(self, method, url, *args, **kwargs):
+        breaker = self.circuit_breaker
+        if breaker is None:
+            return super().request(method, url, *args, **kwargs)
+
+        host, endpoint = breaker.keys(url, kwargs.get('params'))
+        breaker.acquire(host, endpoint)
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException as error:
+            breaker.record(host, endpoint, not breaker.is_failure(error))
+            raise
+        except BaseException:
+            breaker.record(host, endpoint, True)
+            raise
+        breaker.record(host, endpoint, response.status_code < 500)
+        return response
+
+    def _send_selected(self, method, url, *args, **kwargs):
+        """
+        Send a request to the selected server and record the outcome with the server selector.
+
+        When the server can not be reached (connection error or open circuit) the request is
+        retried once on the next best server.
+        """
+        selector = self.server_selector
+        if selector is None:
+            return self._send(method, url, *args, **kwargs)
+
+        url = selector.resolve(url)
+        try:
+            response = self._send(method, url, *args, **kwargs)
+        except (GrowattCircuitOpenError, requests.exceptions.ConnectionError) as error:
+            selector.record(url, False)
+            # Read timeouts are not retried, the server may have processed the request already
+            fallback = selector.alternative(url)
+            if fallback is None:
+                raise
+            logger.warning("Request to %s failed (%s), retrying on %s", url, error, fallback)
+            url = fallback
+            try:
+                response = self._send(method, url, *args, **kwargs)
+            except GrowattCircuitOpenError:
+                selector.record(url, False)
+                raise
+            except requests.exceptions.RequestException as error:
+                selector.record(url, not CircuitBreaker.is_failure(error))
+                raise
+        except requests.exceptions.RequestException as error:
+            selector.record(url, not CircuitBreaker.is_failure(error))
+            raise
+        selector.record(url, response.status_code < 500)
+        return response
+
+    def request(self, method, url, *args, relogin=True, **kwargs):
+        started = time.monotonic()
+        response = self._send_selected(method, url, *args, **kwargs)
+
+        handler = self.expired_session_handler
+        if relogin and handler is not None and handler(response, started):
+            # Resolved again, the login may have followed a failover to another server
+            response = self._send_selected(method, url, *args, **kwargs)
+
+        return response
@@ -0,0 +1,449 @@
+"""
+Output sinks for polled data, decoupled from polling by a bounded queue.
+"""
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Sink:
+    """
+    Destination of records. Subclasses implement write(), which receives a list of records.
+    """
+
+    def write(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileSink(Sink):
+    """
+    Append every record as a JSON line to a file.
+
+    Args:
+        path (str): The file.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, records):
+        self.file.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class StdoutSink(FileSink):
+    """
+    Write every record as a JSON line to stdout.
+    """
+
+    def __init__(self):
+        self.file = sys.stdout
+
+    def close(self):
+        self.file.flush()
+
+
+class _TopicFields(dict):
+    def __missing__(self, key):
+        return 'unknown'
+
+
+class MqttSink(Sink):
+    """
+    Publish every record as JSON to an MQTT broker. Requires paho-mqtt (`pip install paho-mqtt`).
+
+    Args:
+        host (str): The broker host.
+        port (int): The broker port. Defaults to 1883.
+        topic (str): Topic, formatted with the fields of the record. Defaults to 'growatt/{device_sn}'.
+        qos (int): MQTT quality of service. Defaults to 0.
+        retain (bool): Publish retained messages. Defaults to False.
+        username (str, optional): Username for the broker.
+        password (str, optional): Password for the broker.
+        client_id (str): MQTT client ID. Defaults to '' (generated by the broker).
+        keepalive (int): Keepalive interval in seconds. Defaults to 60.
+        publish_timeout (float): Seconds to wait for a batch to be published. Defaults to 30.
+    """
+
+    def __init__(self, host, port=1883, topic='growatt/{device_sn}', qos=0, retain=False, username=None,
+                 password=None, client_id='', keepalive=60, publish_timeout=30.0):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            raise ImportError("The MQTT sink requires paho-mqtt, install it with `pip install paho-mqtt`")
+
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            # paho-mqtt 2.x
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        else:
+            self.client = mqtt.Client(client_id=client_id)
+        if username is not None:
+            self.client.username_pw_set(username, password)
+        self.topic = topic
+        self.qos = qos
+        self.retain = retain
+        self.publish_timeout = publish_timeout
+        self.client.connect(host, port, keepalive)
+        self.client.loop_start()
+
+    def write(self, records):
+        messages = [self.client.publish(self.topic.format_map(_TopicFields(record)),
+                                        json.dumps(record, default=str), qos=self.qos, retain=self.retain)
+                    for record in records]
+        # Only return once the batch left the client, so a failing broker causes backpressure
+        deadline = time.monotonic() + self.publish_timeout
+        for message in messages:
+            message.wait_for_publish(max(deadline - time.monotonic(), 0))
+            if not message.is_published():
+                raise TimeoutError("Publishing to the MQTT broker timed out")
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class SinkPipeline:
+    """
+    Hand records to a sink in batches from a background thread, so a slow sink does not block polling.
+
+    Records are queued in a bounded queue and written in batches of up to `batch_size`
+    records, at least every `flush_interval` seconds. When the queue is full, the policy
+    decides what happens with new records:
+        'block' -- put() waits until there is room in the queue
+        'drop_oldest' -- the oldest queued record is dropped
+        'spill' -- records are appended to spill_path and written once the sink caught up,
+                   in the order they were put
+
+    A batch the sink fails to write is logged and dropped, with the 'spill' policy it is retried
+    after flush_interval seconds instead. Lines of the spill file that are not valid JSON (e.g. a
+    line cut off by a crash) are logged and skipped.
+
+    Args:
+        sink (Sink): The sink, e.g. FileSink, StdoutSink or MqttSink. It is closed by close().
+        max_queue (int): Maximum number of queued records. Defaults to 1000.
+        batch_size (int): Maximum number of records per write. Defaults to 100.
+        flush_interval (float): Maximum seconds a record waits for its batch to fill up. Defaults to 5.
+        policy (str): 'block', 'drop_oldest' or 'spill'. Defaults to 'block'.
+        spill_path (str, optional): Spill file, required for the 'spill' policy.
+
+    Example:
+        with SinkPipeline(MqttSink("localhost"), policy='drop_oldest') as pipeline:
+            poller.run(pipeline.put)
+    """
+
+    policies = ('block', 'drop_oldest', 'spill')
+
+    def __init__(self, sink, max_queue=1000, batch_size=100, flush_interval=5.0, policy='block', spill_path=None):
+        if policy not in self.policies:
+            raise ValueError(f"policy must be one of {', '.join(self.policies)}")
+        if policy == 'spill' and not spill_path:
+            raise ValueError("The spill policy requires a spill_path")
+
+        self.sink = sink
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.spill_path = spill_path
+        self.stats = {'written': 0, 'dropped': 0, 'spilled': 0, 'failed': 0, 'invalid': 0}
+
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._closing = False
+        # Set when close() timed out, the writer stops after the batch it is writing
+        self._abandoned = False
+        # The batch being written, and whether close() already saved it in the spill file
+        self._batch = []
+        self._batch_persisted = False
+        # Number of flush() calls waiting, the writer does not wait for a full batch meanwhile
+        self._flush_requested = 0
+        # Lines in the spill file not written yet, and the offset of the first one
+        self._spilled = 0
+        self._spill_offset = 0
+        if policy == 'spill' and os.path.exists(spill_path):
+            # Records spilled by a previous run
+            with open(spill_path, 'rb') as spill:
+                content = spill.read()
+            self._spilled = sum(1 for line in content.splitlines() if line.strip())
+            if content and not content.endswith(b'\n'):
+                # Terminate a line cut off by a crash, so it does not merge with the next record
+                with open(spill_path, 'a', encoding='utf-8') as spill:
+                    spill.write('\n')
+
+        self._thread = threading.Thread(target=self._run, name='growatt-sink', daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        """
+        Queue a record, applying the backpressure policy when the queue is full.
+        """
+        with self._condition:
+            if self._closing:
+                raise RuntimeError("SinkPipeline is closed")
+            if self.policy == 'spill' and (self._spilled or len(self._queue) >= self.max_queue):
+                self._spill([record])
+                self._condition.notify_all()
+                return
+            while len(self._queue) >= self.max_queue:
+                if self.policy == 'block':
+                    self._condition.wait()
+                    if self._closing:
+                        raise RuntimeError("SinkPipeline is closed")
+                else:
+                    self._queue.popleft()
+                    self.stats['dropped'] += 1
+            self._queue.append(record)
+            self._condition.notify_all()
+
+    __call__ = put
+
+    def _spill(self, records):
+        """
+        Append records to the spill file, must be called with the condition held.
+        """
+        with open(self.spill_path, 'a', encoding='utf-8') as spill:
+            spill.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+        self._spilled += len(records)
+        self.stats['spilled'] += len(records)
+
+    def _unspill(self, count):
+        """
+        Read up to count spilled records, must be called with the condition held.
+        """
+        records = []
+        read = 0
+        with open(self.spill_path, encoding='utf-8') as spill:
+            spill.seek(self._spill_offset)
+            while len(records) < count:
+                line = spill.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                read += 1
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError as error:
+                    logger.warning("Skipping invalid record in spill file %s: %s", self.spill_path, error)
+                    self.stats['invalid'] += 1
+            self._spill_offset = spill.tell()
+        self._spilled -= read
+        if not read or self._spilled <= 0:
+            # Everything was read back, start with an empty file
+            self._spilled = 0
+            self._spill_offset = 0
+            open(self.spill_path, 'w').close()
+        return records
+
+    def _next_batch(self):
+        """
+        Wait for a full batch, the flush interval, a flush() or closing, and take the batch from the queue.
+
+        Returns:
+            list: The batch, empty when there is nothing to write yet, None when the writer should stop.
+        """
+        with self._condition:
+            flush_at = time.monotonic() + self.flush_interval
+            while (len(self._queue) + self._spilled < self.batch_size and not self._closing and
+                   not self._flush_requested and time.monotonic() < flush_at):
+                self._condition.wait(flush_at - time.monotonic())
+
+            if self._abandoned:
+                return None
+            if self._queue:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            elif self._spilled:
+                batch = self._unspill(self.batch_size)
+            else:
+                batch = []
+            self._batch = batch
+            self._batch_persisted = False
+            self._condition.notify_all()
+            if not batch and self._closing and not self._spilled:
+                return None
+            return batch
+
+    def _persist(self):
+        """
+        Move the batch being written and the queued records in front of the spilled records,
+        must be called with the condition held.
+        """
+        remaining = []
+        if self._spilled:
+            with open(self.spill_path, encoding='utf-8') as spill:
+                spill.seek(self._spill_offset)
+                remaining = [line if line.endswith('\n') else line + '\n' for line in spill if line.strip()]
+        records = ([] if self._batch_persisted else self._batch) + list(self._queue)
+        with open(self.spill_path, 'w', encoding='utf-8') as spill:
+            spill.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+            spill.write(''.join(remaining))
+        self.stats['spilled'] += len(records)
+        # A batch saved before is part of the remaining lines
+        self._spilled = len(records) + len(remaining)
+        self._spill_offset = 0
+        self._batch_persisted = bool(self._batch)
+        self._queue.clear()
+
+    def _unpersist(self, count):
+        """
+        Remove the first count records (the batch saved by close() and written after all) from
+        the spill file, must be called with the condition held.
+        """
+        with open(self.spill_path, encoding='utf-8') as spill:
+            lines = [line for line in spill if line.strip()]
+        with open(self.spill_path, 'w', encoding='utf-8') as spill:
+            spill.write(''.join(lines[count:]))
+        self._spilled = max(self._spilled - count, 0)
+
+    def _write_next(self):
+        """
+        Write the next batch.
+
+        Returns:
+            bool: False when the writer should stop.
+        """
+        batch = self._next_batch()
+        if batch is None:
+            return False
+        if not batch:
+            return True
+
+        try:
+            self.sink.write(batch)
+            written = True
+        except Exception as error:
+            logger.warning("Writing %d records to %s failed: %s", len(batch), type(self.sink).__name__, error)
+            written = False
+
+        with self._condition:
+            try:
+                if written:
+                    self.stats['written'] += len(batch)
+                    if self._batch_persisted:
+                        # close() timed out and saved the batch, which was written after all
+                        self._unpersist(len(batch))
+                elif self.policy != 'spill':
+                    self.stats['failed'] += len(batch)
+                elif self._closing:
+                    # Keep the batch in front of the queued and spilled records for the next run
+                    self._persist()
+                    return False
+                else:
+                    # Retry the batch before newer records
+                    self._queue.extendleft(reversed(batch))
+                    self._batch = []
+                    self._wait(self.flush_interval)
+                return not self._abandoned
+            finally:
+                self._batch = []
+                self._batch_persisted = False
+                self._condition.notify_all()
+
+    def _wait(self, seconds):
+        """
+        Wait for seconds or closing, must be called with the condition held. Records put
+        meanwhile wake the condition but do not shorten the wait.
+        """
+        wait_until = time.monotonic() + seconds
+        while not self._closing and time.monotonic() < wait_until:
+            self._condition.wait(wait_until - time.monotonic())
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    if not self._write_next():
+                        return
+                except Exception:
+                    logger.exception("Writer of %s failed", type(self.sink).__name__)
+                    with self._condition:
+                        if self._closing:
+                            return
+                        self._wait(self.flush_interval)
+        finally:
+            # Closed by the writer, so the sink is never closed during a write
+            try:
+                self.sink.close()
+            except Exception:
+                logger.exception("Closing %s failed", type(self.sink).__name__)
+            with self._condition:
+                self._batch = []
+                self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Wait until all queued (and spilled) records are written.
+
+        With the 'spill' policy a failing sink is retried until it succeeds, so without a
+        timeout flush() does not return while the sink keeps failing.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait.
+
+        Returns:
+            bool: True when everything was written, False when the timeout expired or the
+                pipeline was closed first.
+        """
+        with self._condition:
+            # Make the writer write partial batches instead of waiting for the flush interval
+            self._flush_requested += 1
+            self._condition.notify_all()
+            try:
+                flush_at = None if timeout is None else time.monotonic() + timeout
+                while self._queue or self._spilled or self._batch:
+                    if not self._thread.is_alive():
+                        return False
+                    remaining = None if flush_at is None else flush_at - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                self._flush_requested -= 1
+        return True
+
+    def close(self, timeout=None):
+        """
+        Write the remaining records and close the sink.
+
+        With the 'spill' policy, records that could not be written (because the sink fails or
+        the timeout expired) are kept in the spill file and written by the next SinkPipeline
+        using it. With the other policies records not written within the timeout are dropped.
+
+        When the timeout expires during a write, the writer stops once the write returns and
+        closes the sink then. A batch it was writing is kept in the spill file until the write
+        succeeded, so it is neither lost nor written twice.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for the remaining records.
+        """
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            with self._condition:
+                self._abandoned = True
+                if self.policy == 'spill':
+                    self._persist()
+                else:
+                    self.stats['dropped'] += len(self._queue)
+                    self._queue.clear()
+                self._condition.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
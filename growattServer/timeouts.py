@@ -0,0 +1,92 @@
+"""
+Request timeouts and deadlines shared by compound operations.
+"""
+import contextlib
+import contextvars
+import time
+
+_deadline = contextvars.ContextVar('growatt_deadline', default=None)
+_timeout = contextvars.ContextVar('growatt_timeout', default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    Give every request made in the block one shared time budget.
+
+    Each request is sent with a timeout no longer than the remaining budget, and once the
+    budget is used up the remaining requests raise GrowattDeadlineExceededError without
+    being sent. Nested deadlines never extend the budget of the outer block.
+
+    The deadline applies to requests made from the current thread (and asyncio task), and from
+    the worker threads of the library's own concurrent operations, see in_context().
+
+    Args:
+        seconds (float): The time budget of the block.
+
+    Example:
+        with growattServer.deadline(20):
+            devices = api.device_list(plant_id)  # plant_info and its fallback share the 20 seconds
+    """
+    expires = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None:
+        expires = min(expires, outer)
+    token = _deadline.set(expires)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def request_timeout(timeout):
+    """
+    Override the session timeout for the requests made in the block.
+
+    Args:
+        timeout (float or tuple): Seconds, or a (connect, read) tuple, see requests.
+
+    Example:
+        with growattServer.request_timeout((3, 10)):
+            api.min_energy(device_sn)
+    """
+    token = _timeout.set(timeout)
+    try:
+        yield
+    finally:
+        _timeout.reset(token)
+
+
+def current_deadline():
+    """
+    The time.monotonic() value the current deadline expires at, None without deadline.
+    """
+    return _deadline.get()
+
+
+def current_timeout(default):
+    """
+    The timeout of the current request_timeout() block, or default outside one.
+    """
+    timeout = _timeout.get()
+    return default if timeout is None else timeout
+
+
+def in_context(function):
+    """
+    Wrap a function to run in the context (deadline and timeout) of the caller, for use in worker threads.
+
+    Context variables are not inherited by ThreadPoolExecutor workers, so without this
+    requests made by the workers would ignore the caller's deadline() and request_timeout().
+
+    Example:
+        with ThreadPoolExecutor() as executor:
+            results = list(executor.map(in_context(fetch), items))
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so every call runs in its own copy
+        return context.copy().run(function, *args, **kwargs)
+    return run
@@ -0,0 +1,157 @@
+"""
+Parsing of the unit strings returned by the ShinePhone API, e.g. '10.2kWh' or '50.2%'.
+"""
+import re
+from functools import lru_cache
+
+# Unit as returned by the server -> (canonical unit, factor to convert to it). Units are matched
+# case-sensitively, so mW (milliwatt) and MW (megawatt) can not be confused.
+UNITS = {
+    '': (None, 1.0),
+    'mW': ('kW', 0.000001),
+    'W': ('kW', 0.001),
+    'Watt': ('kW', 0.001),
+    'kW': ('kW', 1.0),
+    'KW': ('kW', 1.0),
+    'kw': ('kW', 1.0),
+    'MW': ('kW', 1000.0),
+    'Wh': ('kWh', 0.001),
+    'kWh': ('kWh', 1.0),
+    'KWh': ('kWh', 1.0),
+    'kwh': ('kWh', 1.0),
+    'MWh': ('kWh', 1000.0),
+    '%': ('%', 1.0),
+    'V': ('V', 1.0),
+    'A': ('A', 1.0),
+    'Hz': ('Hz', 1.0),
+    '°C': ('°C', 1.0),
+    '℃': ('°C', 1.0),
+}
+
+# Identifiers are numeric strings too, fields matching this are never parsed
+_IDENTIFIER = re.compile(r'(^id$|Id$|Sn$|SN$|^sn$)')
+
+_DIGITS = re.compile(r'(\d+)')
+_VALUE = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([^\d\s]*)\s*$')
+
+
+@lru_cache(maxsize=4096)
+def _parse_string(value):
+    match = _VALUE.match(value)
+    if match is None:
+        return None
+    unit = UNITS.get(match.group(2))
+    if unit is None:
+        return None
+    return float(match.group(1)) * unit[1], unit[0]
+
+
+def _time_key(time):
+    """
+    Sort key ordering the numbers in a chart time key numerically, so month and year charts
+    keyed '1', '2', ..., '10' (not zero-padded) stay in order.
+    """
+    return [int(part) if part.isdigit() else part for part in _DIGITS.split(str(time))]
+
+
+def parse_value(value, default_unit=None):
+    """
+    Parse a value with an optional unit into a number in canonical units.
+
+    Power is converted to kW and energy to kWh, e.g. '200Watt' -> (0.2, 'kW').
+
+    Args:
+        value (str, int or float): The value, e.g. '10.2kWh', '50.2%' or '0.93'.
+        default_unit (str, optional): Unit of values without one, e.g. 'kW' for chart data.
+
+    Returns:
+        tuple: (number, unit), or None if the value is not numeric or the unit is unknown.
+            unit is None for values without unit and default_unit.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        number, unit = float(value), None
+    else:
+        parsed = _parse_string(value)
+        if parsed is None:
+            return None
+        number, unit = parsed
+
+    if unit is None and default_unit:
+        canonical, factor = UNITS.get(default_unit, (default_unit, 1.0))
+        return number * factor, canonical
+    return number, unit
+
+
+def parse_chart_data(chart_data, unit=None):
+    """
+    Turn a chartData object ({'00:05': {'ppv': '0.93', ...}, ...}) into columns.
+
+    Args:
+        chart_data (dict): The chartData object of e.g. dashboard_data, mix_detail or tlx_energy_prod_cons.
+        unit (str, optional): Unit of the values, e.g. the 'chartDataUnit' or 'unit2' of the response.
+
+    Returns:
+        dict: 'time' -> list of the time keys in (numeric) order, and every series -> list of floats
+            (in canonical units) in the same order, None where a value is missing or not numeric.
+    """
+    chart_data = chart_data or {}
+    times = sorted(chart_data)
+    if len({len(str(time)) for time in times}) > 1:
+        # Not zero-padded (e.g. months '1' to '12'), text order would put '10' before '2'
+        times.sort(key=_time_key)
+    factor = UNITS.get(unit, (unit, 1.0))[1] if unit else 1.0
+
+    columns = {'time': times}
+    for index, time in enumerate(times):
+        entry = chart_data[time]
+        if not isinstance(entry, dict):
+            continue
+        for field, value in entry.items():
+            column = columns.get(field)
+            if column is None:
+                column = columns[field] = [None] * len(times)
+            try:
+                # Chart values are plain numeric strings, only fall back to unit parsing when needed
+                column[index] = float(value) * factor
+            except (TypeError, ValueError):
+                parsed = parse_value(value, unit)
+                column[index] = parsed[0] if parsed else None
+    return columns
+
+
+def parse_units(data, numeric_fields=()):
+    """
+    Parse all values with units in a ShinePhone response, e.g. from dashboard_data, mix_detail or noah_system_status.
+
+    Strings with a unit are converted to floats in canonical units (kW, kWh, %), the chartData
+    object is converted with parse_chart_data() and all other values are kept as they are.
+    Plain numeric strings (status and mode codes, IDs, ...) are only converted for the fields
+    in numeric_fields. Identifiers (fields named 'id' or ending in 'Id' or 'Sn') are never converted.
+
+    Args:
+        data (dict): The response.
+        numeric_fields (iterable, optional): Fields whose plain numeric strings are converted to floats too.
+
+    Returns:
+        dict: A copy of the response with parsed values, plus 'units' mapping every parsed
+            field to its canonical unit (None for plain numbers).
+    """
+    chart_unit = data.get('chartDataUnit') or data.get('unit2')
+    numeric_fields = frozenset(numeric_fields)
+    parsed_data = {}
+    units = {}
+    for field, value in data.items():
+        if field == 'chartData' and isinstance(value, dict):
+            parsed_data[field] = parse_chart_data(value, chart_unit)
+            continue
+        if isinstance(value, str) and not _IDENTIFIER.search(field):
+            parsed = parse_value(value)
+            if parsed is not None and (parsed[1] is not None or field in numeric_fields):
+                parsed_data[field], units[field] = parsed
+                continue
+        parsed_data[field] = value
+
+    parsed_data['units'] = units
+    return parsed_data